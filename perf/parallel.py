@@ -0,0 +1,243 @@
+"""
+Parallel parity check. Builds a corpus big enough to be converted in
+parallel (copies of perf/corpus, over pymd.PARALLEL_MIN files, with meta
+titles and wiki links to the next chapter) as pages, merged and book, with
+-j 1 and with worker processes (--jobs), and lists the outputs that
+differ. The anchors of the merged file are checked too: ids renamed across
+chapters, links to them, wiki links to a chapter's section, wiki links in
+code left as written. Exits with 1 if any differs or an anchor is wrong.
+"""
+
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import sys
+import os
+import io
+import re
+import glob
+import shutil
+import difflib
+import tempfile
+import argparse
+import subprocess
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+
+import pymd
+
+# ---------------------
+# Config
+# ---------------------
+
+CORPUS = os.path.join(HERE, 'corpus')
+PYMD   = os.path.join(os.path.dirname(HERE), 'pymd.py')
+
+# name, pymd arguments (besides source, output & jobs)
+SCENARIOS = (
+		('pages', []),
+		('merge', ['merge']),
+		('book',  ['book'])
+	)
+
+# anchors of the merged file
+ID      = re.compile(r'\sid="([^"]+)"')
+HREF    = re.compile(r'href="#([^"]+)"')
+RENAMED = re.compile(r'_\d+$')
+NEXT    = re.compile(r'Next: <a href="#([^"]+)">[^<]*</a>, <a href="#([^"]+)">its start</a>')
+
+# ---------------------
+# Methods
+# ---------------------
+
+def args():
+	""" Arguments definition. Returns values as dict """
+
+	parser = argparse.ArgumentParser(description="Compare pymd -j 1 with parallel builds")
+
+	parser.add_argument("--jobs", "-j"
+						, help="Worker processes of the parallel build. Default: %(default)s"
+						, default=2, type=int)
+	parser.add_argument("--diff", "-d"
+						, help="Show the differences"
+						, action="store_true")
+
+	return vars(parser.parse_args())
+
+
+def corpus_make(folder):
+	""" Write the big corpus in folder: a copy of the chapters per subfolder,
+	up to PARALLEL_MIN. Each chapter has a meta title (besides its heading)
+	and links to the next one without text, so it gets the title, and the 
+	same link in code (a span and a fenced block). Returns the number of 
+	chapters
+	"""
+
+	chapters = sorted(glob.glob(os.path.join(CORPUS, 'chapter*.md')))
+	copies   = pymd.PARALLEL_MIN // len(chapters) + 1
+	total    = 0
+
+	shutil.copy(os.path.join(CORPUS, '_header.md'), folder)
+
+	for copy in range(1, copies + 1):
+		os.mkdir(os.path.join(folder, 'part%d' % copy))
+
+		for i, chapter in enumerate(chapters):
+			with io.open(chapter, 'r', encoding='utf-8') as chapterFile:
+				text = chapterFile.read()
+
+			following = os.path.basename(chapters[(i + 1) % len(chapters)])
+			name      = os.path.basename(chapter)
+
+			# chapterN.md has "Section N.1", id section-N1
+			text = "Title: Part %d, %s\n\n" % (copy, name) + text + \
+					"\n\nNext: [](file|%s), [its start](file|%s#section-%d1).\n" % (
+						following, following, int(following[7:-3])) + \
+				"\nWritten `[](file|%s)`, or:\n\n```\n[](file|%s)\n```\n" % (following, following)
+
+			with io.open(os.path.join(folder, 'part%d' % copy, name), 'w', encoding='utf-8') as copyFile:
+				copyFile.write(text)
+
+			total += 1
+
+	return total
+
+
+def build(source, folder, argv):
+	""" Build source in folder/out with pymd (a new process) """
+
+	os.mkdir(folder)
+
+	with open(os.devnull, 'w') as devnull:
+		code = subprocess.call([sys.executable, PYMD, source, '-o', 'out'] + argv,
+								cwd=folder, stdout=devnull)
+
+	if code:
+		sys.exit("pymd failed: " + " ".join(argv))
+
+	return os.path.join(folder, 'out')
+
+
+def outputs(folder):
+	""" Outputs in folder: {relative path: bytes} """
+
+	found = dict()
+
+	for root, _, files in os.walk(folder):
+		for name in files:
+			path = os.path.join(root, name)
+
+			with open(path, 'rb') as outputFile:
+				found[os.path.relpath(path, folder)] = outputFile.read()
+
+	return found
+
+
+def compare(one, many, showDiff):
+	""" Outputs that differ between the folders. Returns list of paths """
+
+	one    = outputs(one)
+	many   = outputs(many)
+	differ = list()
+
+	for path in sorted(set(one) | set(many)):
+		if one.get(path) != many.get(path):
+			differ.append(path)
+
+			if showDiff:
+				lines = [(found.get(path) or b"").decode('utf-8-sig').splitlines() for found in (one, many)]
+
+				for line in difflib.unified_diff(lines[0], lines[1], "-j 1", "parallel", lineterm="", n=1):
+					print ("          " + line)
+
+	return differ
+
+
+def anchors(html, chapters):
+	""" Wrong anchors of the merged file (of corpus_make() chapters): 
+	repeated ids, links without id, wiki links to a section that isn't in 
+	the chapter they link to, wiki links in code that were made. Returns 
+	list of text
+	"""
+
+	problems = list()
+	ids      = dict() # id: position
+
+	for match in ID.finditer(html):
+		if match.group(1) in ids:
+			problems.append("repeated id: " + match.group(1))
+
+		ids[match.group(1)] = match.start()
+
+	for anchor in sorted(set(HREF.findall(html)) - set(ids)):
+		problems.append("no id for #" + anchor)
+
+	if not any(RENAMED.search(anchor) for anchor in ids):
+		problems.append("no renamed ids")
+
+	links    = NEXT.findall(html)
+	articles = [match.start() for match in re.finditer(r'<article', html)]
+
+	if len(links) != chapters:
+		problems.append("%d wiki links, not %d" % (len(links), chapters))
+
+	written = html.count("[](file|")
+
+	if written != 2 * chapters:
+		problems.append("%d wiki links in code, not %d" % (written, 2 * chapters))
+
+	for chapter, section in links:
+		if chapter in ids and section in ids:
+			end = next((start for start in articles if start > ids[chapter]), len(html))
+
+			if not ids[chapter] < ids[section] < end:
+				problems.append("#%s isn't in #%s" % (section, chapter))
+
+	return problems
+
+
+# -------------------
+# The program
+# -------------------
+
+if __name__ == '__main__':
+	settings = args()
+
+	if settings['jobs'] < 2:
+		sys.exit("the parallel build needs 2 jobs or more")
+
+	work   = tempfile.mkdtemp(prefix='pymd-parallel-')
+	source = os.path.join(work, 'source')
+
+	try:
+		os.mkdir(source)
+		chapters = corpus_make(source)
+		print ("    %d chapters" % chapters)
+
+		differences = 0
+
+		for name, argv in SCENARIOS:
+			one    = build(source, os.path.join(work, name + '-1'), argv + ['-j', '1'])
+			many   = build(source, os.path.join(work, name + '-n'), argv + ['-j', str(settings['jobs'])])
+			differ = compare(one, many, settings['diff'])
+
+			print ("      %-8s %s" % (name, "differs: " + ", ".join(differ) if differ else "ok"))
+
+			differences += len(differ)
+
+			if name == 'merge':
+				for path in glob.glob(os.path.join(many, '*.html')):
+					with io.open(path, 'r', encoding='utf-8-sig') as mergedFile:
+						problems = anchors(mergedFile.read(), chapters)
+
+					print ("      %-8s %s" % ("anchors", "; ".join(problems) if problems else "ok"))
+
+					differences += len(problems)
+	finally:
+		shutil.rmtree(work)
+
+	if differences:
+		sys.exit(1)
+
+	print ("\n    ok")
@@ -0,0 +1,129 @@
+"""
+Engine parity check. Converts the parity corpus (perf/parity, one file per
+feature: meta, toc, tables, fenced code, admonitions) with the markdown
+engine and with the others (--engine), and lists the features whose html,
+toc or meta differ. Whitespace between tags is ignored. Exits with 1 if
+any differs.
+"""
+
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import sys
+import os
+import re
+import glob
+import difflib
+import argparse
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+
+import pymd
+
+# ---------------------
+# Config
+# ---------------------
+
+CORPUS    = os.path.join(HERE, 'parity')
+REFERENCE = 'markdown'
+
+# ---------------------
+# Methods
+# ---------------------
+
+def args():
+	""" Arguments definition. Returns values as dict """
+
+	parser = argparse.ArgumentParser(description="Compare the output of the pymd engines")
+
+	parser.add_argument("engines"
+						, help="Engines to compare with " + REFERENCE + ". Default: the installed ones"
+						, nargs='*', default=[], metavar='ENGINE')
+	parser.add_argument("--diff", "-d"
+						, help="Show the differences"
+						, action="store_true")
+
+	return vars(parser.parse_args())
+
+
+def installed():
+	""" Engines besides the reference whose library is installed """
+
+	return [name for name in pymd.ENGINES if name != REFERENCE and getattr(pymd, name, None) is not None]
+
+
+def normalize(html):
+	""" Lines to compare: whitespace between tags doesn't count """
+
+	html = re.sub(r'>\s+<', '><', html.strip())
+
+	return re.sub(r'><', '>\n<', html).split('\n')
+
+
+def convert(engine, path):
+	""" html, toc & meta (as lines) of the file with the engine """
+
+	pymd.CONFIG['engine'] = engine
+
+	text = pymd.text_metaCheck(pymd.file_read(path))
+	html, toc, meta = pymd.engine_run(text)
+
+	meta = ["%s: %s" % (key.lower(), " | ".join(meta[key])) for key in sorted(meta)]
+
+	return {'html': normalize(html), 'toc': normalize(toc), 'meta': meta}
+
+
+def compare(engine, path, showDiff):
+	""" Parts of the file (html, toc, meta) that differ from the reference """
+
+	reference = convert(REFERENCE, path)
+	other     = convert(engine, path)
+	differ    = list()
+
+	for part in ('html', 'toc', 'meta'):
+		if reference[part] != other[part]:
+			differ.append(part)
+
+			if showDiff:
+				for line in difflib.unified_diff(reference[part], other[part],
+								REFERENCE, engine, lineterm="", n=1):
+					print ("          " + line)
+
+	return differ
+
+
+# -------------------
+# The program
+# -------------------
+
+if __name__ == '__main__':
+	settings = args()
+	engines  = settings['engines'] or installed()
+
+	if not engines:
+		sys.exit("no other engine installed")
+
+	for engine in engines:
+		if engine not in pymd.ENGINES or engine == REFERENCE:
+			sys.exit("unknown engine: " + engine)
+
+	pymd.configure(pymd.args([CORPUS]))
+
+	differences = 0
+
+	for engine in engines:
+		print ("    " + engine)
+
+		for path in sorted(glob.glob(os.path.join(CORPUS, '*.md'))):
+			feature = os.path.splitext(os.path.basename(path))[0]
+			differ  = compare(engine, path, settings['diff'])
+
+			print ("      %-12s %s" % (feature, "differs: " + ", ".join(differ) if differ else "ok"))
+
+			differences += len(differ)
+
+	if differences:
+		sys.exit(1)
+
+	print ("\n    ok")
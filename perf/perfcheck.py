@@ -0,0 +1,239 @@
+"""
+Performance check. Renders the reference corpus (perf/corpus: chapters
+with wiki links, a header and an index) as pages, merged and book, and a
+big one (copies of it over pymd.PARALLEL_MIN files, converted in parallel)
+as merged and book, measuring wall time, conversions and peak memory, and
+compares them with the stored baseline (perf/baseline.json). Exits with 1
+if any measure is worse than the baseline plus its tolerance.
+
+Each scenario runs in a new process (so peak memory is its own) several
+times; the best run is kept. Record a new baseline with --update (times and
+memory depend on the machine, so record it where the check runs).
+"""
+
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals, division
+
+import sys
+import os
+import json
+import time
+import shutil
+import tempfile
+import argparse
+import multiprocessing
+
+try:
+	import resource
+except ImportError:
+	resource = None # windows: no peak memory
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+
+import pymd
+
+from parallel import corpus_make
+
+# ---------------------
+# Config
+# ---------------------
+
+CORPUS   = os.path.join(HERE, 'corpus')
+BASELINE = os.path.join(HERE, 'baseline.json')
+
+# name, pymd arguments (besides source & output), corpus: small or big
+SCENARIOS = (
+		('pages',     [],        'small'),
+		('merge',     ['merge'], 'small'),
+		('book',      ['book'],  'small'),
+		('merge-big', ['merge'], 'big'),
+		('book-big',  ['book'],  'big')
+	)
+
+# allowed increase over the baseline, as fraction. Above the noise of the
+# best of 5 runs: up to 15% in seconds (more on busy machines), 3% in memory
+TOLERANCE = {
+	  'seconds'     : 0.5
+	, 'conversions' : 0.0
+	, 'peak_mb'     : 0.1
+}
+
+MEASURES = ('seconds', 'conversions', 'peak_mb')
+
+# ---------------------
+# Methods
+# ---------------------
+
+def args():
+	""" Arguments definition. Returns values as dict """
+
+	parser = argparse.ArgumentParser(description="Check pymd speed & memory against a baseline")
+
+	parser.add_argument("--runs", "-r"
+						, help="Runs per scenario, the best is kept. Default: %(default)s"
+						, default=5, type=int)
+	parser.add_argument("--tolerance", "-t"
+						, help="Allowed increase, as MEASURE=FRACTION (measures: " +
+							   ", ".join(MEASURES) + ")"
+						, action="append", default=[], metavar='MEASURE=FRACTION')
+	parser.add_argument("--baseline"
+						, help="Baseline file. Default: perf/baseline.json"
+						, default=BASELINE, metavar='FILE')
+	parser.add_argument("--update"
+						, help="Save the results as the new baseline"
+						, action="store_true")
+
+	return vars(parser.parse_args())
+
+
+def peak_mb():
+	""" Peak resident memory of this process in MB (0 if unknown) """
+
+	if resource is None:
+		return 0
+
+	peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+	# bytes in mac, kilobytes in linux
+	if sys.platform == 'darwin':
+		return peak / (1024 * 1024)
+
+	return peak / 1024
+
+
+def scenario_child(source, argv, queue):
+	""" Runs in a new process: build source and put the measures in queue """
+
+	output = tempfile.mkdtemp(prefix='pymd-perf-')
+
+	try:
+		start = time.time()
+		pymd.build(pymd.args([source, '-o', output] + argv))
+		seconds = time.time() - start
+	finally:
+		shutil.rmtree(output)
+
+	queue.put({
+		  'seconds'     : round(seconds, 4)
+		, 'conversions' : pymd.STATS.get('conversions', 0)
+		, 'peak_mb'     : round(peak_mb(), 2)
+	})
+
+
+def scenario_run(source, argv, runs):
+	""" Best (lowest) measures of some runs of a scenario """
+
+	best = dict()
+
+	for _ in range(runs):
+		queue = multiprocessing.Queue()
+		child = multiprocessing.Process(target=scenario_child, args=(source, argv, queue))
+		child.start()
+		child.join()
+
+		if child.exitcode:
+			sys.exit("the build failed: pymd " + " ".join(argv))
+
+		measures = queue.get()
+
+		for key in MEASURES:
+			best[key] = min(best.get(key, measures[key]), measures[key])
+
+	return best
+
+
+def tolerance_get(baseline, cli):
+	""" Tolerances: defaults, then the ones in the baseline, then command line """
+
+	tolerance = dict(TOLERANCE)
+	tolerance.update(baseline.get('tolerance', {}))
+
+	for item in cli:
+		key, _, value = item.partition('=')
+
+		if key not in MEASURES:
+			sys.exit("unknown measure: " + key)
+
+		tolerance[key] = float(value)
+
+	return tolerance
+
+
+def compare(results, baseline, tolerance):
+	""" Measures worse than the baseline plus tolerance. Returns list of text """
+
+	regressions = list()
+
+	for name, measures in results:
+		base = baseline.get('scenarios', {}).get(name)
+
+		if not base:
+			continue
+
+		for key in MEASURES:
+			limit = base[key] * (1 + tolerance[key])
+
+			if measures[key] > limit:
+				regressions.append("%s %s: %s > %s (baseline %s +%d%%)" % (name, key,
+									measures[key], round(limit, 4), base[key], tolerance[key] * 100))
+
+	return regressions
+
+
+def report(results, baseline):
+	""" Print the measures and the baseline ones (in parentheses) """
+
+	print ("    %-10s %22s %22s %22s" % (("scenario",) + MEASURES))
+
+	for name, measures in results:
+		base = baseline.get('scenarios', {}).get(name, {})
+		cols = ["%s (%s)" % (measures[key], base.get(key, "-")) for key in MEASURES]
+
+		print ("    %-10s %22s %22s %22s" % tuple([name] + cols))
+
+
+# -------------------
+# The program
+# -------------------
+
+if __name__ == '__main__':
+	settings = args()
+	baseline = dict()
+
+	if os.path.exists(settings['baseline']):
+		with open(settings['baseline'], 'r') as baselineFile:
+			baseline = json.load(baselineFile)
+
+	tolerance = tolerance_get(baseline, settings['tolerance'])
+	big       = tempfile.mkdtemp(prefix='pymd-perf-corpus-')
+
+	try:
+		corpus_make(big)
+		sources = {'small': CORPUS, 'big': big}
+		results = [(name, scenario_run(sources[corpus], argv, settings['runs'])) 
+						for name, argv, corpus in SCENARIOS]
+	finally:
+		shutil.rmtree(big)
+
+	report(results, baseline)
+
+	if settings['update']:
+		baseline['scenarios'] = dict(results)
+		baseline['tolerance'] = tolerance
+
+		with open(settings['baseline'], 'w') as baselineFile:
+			json.dump(baseline, baselineFile, indent=1, sort_keys=True)
+
+		print ("\n    baseline saved")
+		sys.exit()
+
+	regressions = compare(results, baseline, tolerance)
+
+	for regression in regressions:
+		print ("    REGRESSION " + regression)
+
+	if regressions:
+		sys.exit(1)
+
+	print ("\n    ok")
@@ -13,7 +13,8 @@ serif using the --serif flag. You can specify an external one with --css
 It does includes all the extensions: extra (abbreviations, attributes lists, 
 definition lists, fenced code blocks, footnotes, tables, smart strong), 
 admonition, codehilite, headerid, meta, nl2br, sane_lists, toc, wikilinks; 
-but you can include your own with the -extension flag
+but you can include your own with the -extension flag, or leave some out 
+in a folder with an _extensions file (-codehilite, -nl2br...)
 
 The header file is just a normal markdown file that is shared among the 
 "project" (each files will have the same header file) or is the header/title 
@@ -37,14 +38,59 @@ from __future__ import unicode_literals
 import sys
 import os
 import codecs
+import copy
+import re
 import argparse
 import errno
+import hashlib
+import json
+import threading
+import socket
+import multiprocessing
+import signal
+import stat
+import shutil
+import time
+import contextlib
+import mmap
+import collections
 try:
 	import markdown
+	import markdown.extensions.toc # ids & toc for other engines
 except ImportError, e:
 	print ("Markdown library not installed")
 	sys.exit()
 
+try:
+	from urllib import quote, unquote
+except ImportError:
+	from urllib.parse import quote, unquote
+
+try:
+	import Queue as queue
+except ImportError:
+	import queue
+
+try:
+	from StringIO import StringIO # print writes bytes too in python 2
+except ImportError:
+	from io import StringIO
+
+try:
+	import mistune # optional engine
+except ImportError:
+	mistune = None
+
+try:
+	import fcntl # reflinks
+except ImportError:
+	fcntl = None
+
+try:
+	import resource
+except ImportError:
+	resource = None
+
 # --------------------------
 # info 
 # --------------------------
@@ -77,6 +123,31 @@ MY_EPILOG = "  Using %(prog)s version " + __version__
 
 HEADER_FILENAME = "_header"
 INDEX_FILENAME  = "_index"
+EXTENSIONS_FILENAME = "_extensions" # extensions profile of a folder
+DEPS_FILENAME   = ".pymd-deps.json"    # next to the output: .NAME.pymd-deps.json
+CHANGED_FILENAME = ".pymd-changed.txt" # next to the output: .NAME.pymd-changed.txt
+ASSETS_FOLDER   = "_assets" # in output, for assets outside the source folder
+BOOK_FOLDER     = "book"    # in output, for the book when there are other targets
+
+TARGETS = ('pages', 'merge', 'book')
+
+READ_THREADS = 4        # threads reading sources ahead of the conversion
+READ_AHEAD   = 16       # sources read ahead
+MMAP_SIZE    = 16 << 20 # sources this big (bytes) are mapped, not read
+
+PARALLEL_MIN = 64 # files; smaller projects aren't worth starting the workers
+
+DAEMON_GRACE = 10 # seconds the running requests get to finish when the daemon stops
+
+# ids and links to them (headings, footnotes...), renamed in merged files
+ANCHOR = re.compile(r'(\sid="|href="#)([^"]+)(")')
+
+# headings without id (engines other than markdown)
+HEADING = re.compile(r'<h([1-6])>(.*?)</h\1>', re.DOTALL)
+
+# meta-data lines, as the meta extension reads them
+META_LINE = re.compile(r'^[ ]{0,3}([A-Za-z0-9_-]+):\s*(.*)')
+META_MORE = re.compile(r'^[ ]{4,}(.*)')
 
 # must be list
 SELECTED_EXTENSIONS = [
@@ -95,6 +166,67 @@ NEEDED_META = (
 EXTENSIONS_ACCEPTED = ("txt", "md", "markdown")
 PY_VER = sys.version_info[0]
 
+STDIN_SOURCE = "-"
+DAEMON_ENV   = "PYMD_DAEMON"
+
+# Markdown instances, one per thread (they aren't thread safe)
+CONVERTERS = threading.local()
+
+# Page layout. Slots: title, css (style or link tag), meta & body
+PAGE_TEMPLATE = """<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>{{title}}</title>
+{{css}}
+</head>
+<body>
+{{meta}}{{body}}</body>
+</html>"""
+
+# compiled templates, by (template file, css, serif)
+TEMPLATES = dict()
+
+# outputs changed by the running build (OutputChanges)
+CHANGES = None
+
+# assets of the running build (AssetMirror), if --assets
+ASSETS = None
+
+# ioctl to clone a file (copy on write): btrfs, xfs...
+FICLONE = 0x40049409
+
+# memory measures of the running build (MemReport), if --mem-report/--mem-budget
+MEMORY = None
+
+# sources reader of the running build (SourceLoader)
+LOADER = None
+
+# wiki links of the running build (LinkTable)
+LINKS = None
+
+# output folders of the running build, (live, staging), if --atomic
+ATOMIC = None
+
+# progress of the running build (Progress), if --progress
+PROGRESS = None
+
+# time in each extension of the running build (ExtensionProfile), if --profile-extensions
+PROFILE = None
+
+# extension profiles (changes) of the folders, by folder
+PROFILES = dict()
+
+# conversions killed in the running build: (seconds, path)
+TIMEOUTS = list()
+
+# conversion workers (--file-timeout), one per thread
+WORKERS = threading.local()
+
+# counters of this process: conversions...
+STATS      = dict()
+STATS_LOCK = threading.Lock()
+
 # default behaviour config
 CONFIG = {
 	  'source'     : False
@@ -110,6 +242,23 @@ CONFIG = {
 	, 'book'       : False
 	, 'index'      : False
 	, 'nav'        : False
+	, 'incremental': False
+	, 'batch'      : False
+	, 'jobs'       : 0
+	, 'daemon'     : False
+	, 'connect'    : False
+	, 'template'   : False
+	, 'assets'     : False
+	, 'mem_report' : False
+	, 'mem_budget' : 0
+	, 'file_timeout': 0
+	, 'on_timeout' : 'placeholder'
+	, 'targets'    : False
+	, 'engine'     : 'markdown'
+	, 'atomic'     : False
+	, 'progress'   : False
+	, 'profile_extensions': False
+	, 'list_extensions': []
 }
 
 
@@ -118,6 +267,11 @@ class Parsing(object):
 
 	def __init__(self, file_path, isindex=False):
 
+		self.sourcePath = ""
+		self.timedOut   = False
+		self.links      = [] # wiki linked files
+		self.extensions = None # markdown extensions, default: all
+
 		if not isindex:
 			if file_path:
 				self._fileData(file_path)
@@ -134,40 +288,28 @@ class Parsing(object):
 	def read(self, path):
 		""" Read the file (returns string) and check for real meta."""
 
-		cmd = cmd_open_write(path, 'r')
-
-		with cmd as input_file:
-			textfile = input_file.read()
-			input_file.seek(0)
-			
-			# Check if there's real meta or just title with :; 
-			# if not real, add line breaks so it doesn't parse as meta
-			_, line2 = next(input_file), next(input_file)
-
-			if line2.startswith('==') or line2.startswith('--'):
-				textfile = "\n\r " + textfile
+		if LOADER is not None:
+			textfile = LOADER.text(path)
+		else:
+			textfile = file_read(path)
 
-		return textfile
+		return text_metaCheck(textfile)
 
-	def mdParse(self, text):
-		""" Do parsing of file and get: title, meta & toc """
+	def mdParse(self, text, converted=None):
+		""" Do parsing of file and get: title, meta & toc. converted is the 
+		result of engine_run() if it was converted elsewhere
+		"""
 
-		md    = markdown.Markdown(
-							extensions=SELECTED_EXTENSIONS, 
-							output_format="html5")
 		title = ""
 		meta  = ""
 
-		text_html = md.convert(text)
-		
-		# save toc not especified in document
-		try:
-		    toc = md.toc
-		except AttributeError:
-		    toc   = ""
+		if converted is None:
+			converted = md_convert(text, self.extensions)
+
+		text_html, toc, metaDict = converted
 
-		if md.Meta:
-			title, meta = self._metaParse(md.Meta)
+		if metaDict:
+			title, meta = self._metaParse(metaDict)
 
 		if not title:
 			h1 = findH1(text_html)
@@ -175,20 +317,78 @@ class Parsing(object):
 			if h1 is not None:
 				title = h1
 			else:
-				title = self.outputPath
+				title = path_public(self.outputPath)
 
 		self.title = title 
 		self.meta  = meta 
 		self.html  = text_html
 		self.toc   = toc 
 
-	def _fileData(self, path):
-		""" Main method: gets file path property, calls read() & mdParse()"""
+	def prepare(self, path, text):
+		""" Set the paths of the file and mark the wiki links of its text
+		(read()). Returns the markdown to convert
+		"""
 
 		self.outputPath = path_output(path)
+		self.sourcePath = path
+		self.extensions = md_extensions(path)
+
+		if LINKS is not None:
+			text, self.links = LINKS.mark(text, path)
+
+		return text
+
+	def _fileData(self, path):
+		""" Main method: calls read(), prepare() & mdParse()"""
+
+		with mem_measure('document', path):
+			self.convert(path, self.prepare(path, self.read(path)))
+
+			if LINKS is not None:
+				LINKS.setTitle(path, self.title)
+
+	def convert(self, path, text):
+		""" mdParse() the text of path, with a placeholder if its conversion 
+		is killed (--file-timeout) or its worker dies
+		"""
+
+		start = time.time()
+
+		try:
+			self.mdParse(text)
+		except ConvertTimeout as exc:
+			self._timedOut(path, time.time() - start, isinstance(exc, ConvertDied))
+
+	def _timedOut(self, path, seconds, died=False):
+		""" The conversion was killed (--file-timeout) or its worker died: 
+		report it & use a placeholder
+		"""
+
+		if died:
+			message = "    timeout: %s, the converter died after %.1f s" % (path, seconds)
+			listed  = path + " (the converter died)"
+		else:
+			message = "    timeout: %s killed after %.1f s" % (path, seconds)
+			listed  = path
 
-		text = self.read(path)
-		self.mdParse(text)
+		# when filtering, stdout has the pages
+		if CONFIG['source'] == STDIN_SOURCE:
+			sys.stderr.write(message + "\n")
+		else:
+			print (message)
+
+		TIMEOUTS.append((seconds, listed))
+
+		self.timedOut = True
+		self.title    = path_getFilename(path)
+		self.meta     = ""
+		self.toc      = ""
+
+		if died:
+			self.html = '<p class="timeout">This document couldn\'t be converted.</p>'
+		else:
+			self.html = '<p class="timeout">This document took more than ' + \
+						str(CONFIG['file_timeout']) + ' seconds to convert.</p>'
 		
 	def _metaParse(self, dic):
 		"""Take meta dict and converts it to HTML. Returns title and HTML """
@@ -219,870 +419,3285 @@ class Parsing(object):
 		return title, metaHTML
 
 	def save(self):
-		""" Saves file using it properties"""
-
-		# create output tree folders if doesnt exist
-		path_mkdir(path_get(self.outputPath))
+		""" Saves file using it properties. Unchanged files aren't rewritten """
 
-		cmd = cmd_open_write(self.outputPath, 'w')
+		status = file_writeIfChanged(self.outputPath, self.html.encode('utf-8-sig'))
 
-		with cmd as outputFile:
-			outputFile.write(self.html)
+		if status and CHANGES is not None:
+			CHANGES.record(status, self.outputPath)
 
 
-class InputExist(argparse.Action):
-	""" Custom action for args, check if input exists """
+class SourceLoader(object):
+	""" Reads the sources (in order) ahead of their conversion with a few
+	threads, so the reading (slow in network storage) happens while the 
+	previous ones are converted. Sources not asked in order are just read 
+	"""
 
-	def __call__(self, parser, namespace, values, option_string=None):
-		if not os.path.exists(values):
-			parser.error('Source file or folder doesn\'t exist')
+	def __init__(self, paths, prefetch=True):
 
-		setattr(namespace, self.dest, values)
+		self.upcoming = collections.deque(paths if prefetch else [])
+		self.order    = dict((path, i) for i, path in enumerate(paths))
+		self.pending  = dict() # path: read, {'done': Event, 'text' or 'error'}
+		self.requests = queue.Queue()
+		self.threads  = list()
 
+		if prefetch:
+			for _ in range(READ_THREADS):
+				reader = threading.Thread(target=self._reader)
+				reader.daemon = True
+				reader.start()
 
-class OptionsBelong(argparse.Action):
-	""" Custom action for args, check 'belonging' of options """
+				self.threads.append(reader)
 
-	def __call__(self, parser, namespace, values, option_string=None):
+		self._fill()
 
-		if option_string == "--toc" and namespace.merge is False:
-			parser.error('--toc belongs to --merge')
+	def _reader(self):
+		""" Reader thread: read the requested sources until None """
 
-		if option_string in ["--index", "--nav"] and namespace.book is False:
-			parser.error(option_string + ' belongs to --book')
+		while True:
+			request = self.requests.get()
 
-		if option_string == "--nav" or option_string == "-n":
-			values = True
+			if request is None:
+				return
 
-		setattr(namespace, self.dest, values)
+			path, read = request
 
-# ---------------------
-# Methods 
-# ---------------------
+			try:
+				read['text'] = file_read(path)
+			except Exception as exc:
+				read['error'] = exc
 
-def args():
-	""" Arguments definition. Returns values as dict """
+			read['done'].set()
 
-	# to allow --merge to be merge and still being optional
-	subcat_args = ('merge','book')
-	arguments   = ['--' + arg if arg in subcat_args else arg for arg in sys.argv[1:]]
+	def _fill(self):
+		""" Schedule reads up to READ_AHEAD """
 
-	# definitions:
-	parser = argparse.ArgumentParser(
-							formatter_class=argparse.RawTextHelpFormatter, 
-							add_help=False, usage=MY_USAGE, 
-							description=MY_DESCRIPTION, epilog=MY_EPILOG
-							)
+		while self.upcoming and len(self.pending) < READ_AHEAD:
+			path = self.upcoming.popleft()
 
-	group_required = parser.add_argument_group(' Required')
+			if path not in self.pending:
+				self.pending[path] = {'done': threading.Event()}
+				self.requests.put((path, self.pending[path]))
 
-	group_required.add_argument("source"
-						, help="File, folder or .list (mainly used with merge or book)"
-						, action=InputExist)
+	def text(self, path):
+		""" Text of the source """
 
-	group_options = parser.add_argument_group(' Options')
-	
-	group_options.add_argument("--output", "-o" 
-						, help="Output folder to save processed files"
-						, metavar='FOLDER')
-	group_options.add_argument("--flat"
-						, help="Save files in a single directory depth"
-						, action="store_true")
-	group_options.add_argument("--header"
-						, help="Header file, mainly for merged. Could contain title, date and toc (as [TOC_HERE])."
-						, metavar='FILE')
-	group_options.add_argument("--extensions"
-						, help="List of other installed extensions"
-						, nargs='*', metavar='ext')
+		read = self.pending.pop(path, None)
 
-	exclusive_css = group_options.add_mutually_exclusive_group()
-	exclusive_css.add_argument("--css"
-						, help="Custom css with path (as included in href). Default: embeded"
-						, metavar='FILE')
-	exclusive_css.add_argument("--serif"
-						, help="(embeded CSS) pick sans (false) or serif (true). Default: %(default)s"
-						, action='store_true')	
+		if read is None:
+			return file_read(path)
 
-	group_special = parser.add_argument_group(' Specific')
+		# earlier ones weren't asked for (not rebuilt...), don't keep them
+		for early in [early for early in self.pending if self.order[early] < self.order[path]]:
+			del self.pending[early]
 
-	exclusive_style = group_special.add_mutually_exclusive_group()
-	exclusive_style.add_argument("--merge"
-						, help="Merge files into one."
-						, action="store_true")
-	group_special.add_argument  ("--toc", choices = [0, 1, 2, 3, 4, 5] 
-						, help="Toc max depth (for [TOC_HERE]). Default: %(default)s (all)"
-						, default=0 , type=int, action=OptionsBelong)
-	exclusive_style.add_argument("--book"
-						, help="Create a book with navigation (next/prev) between files and an index"
-						, action="store_true")
-	group_special.add_argument  ("--index"
-						, help="Custom index for book"
-						, action=OptionsBelong , metavar='FILE')
-	group_special.add_argument  ("--nav", "-n"
-						, help='Use file titles as the navigation links instead of "prev/next"'
-						, default=False, nargs=0, action=OptionsBelong)
+		self._fill()
+		read['done'].wait()
 
-	group_other = parser.add_argument_group(' Last but not least')
-	group_other.add_argument("--help", "-h", 
-						help="show this help message and exit", action="help") 
+		if 'error' in read:
+			raise read['error']
 
-	return vars(parser.parse_args(arguments))
+		return read['text']
 
+	def close(self):
+		""" Stop the threads, dropping the reads not started """
 
-def index_containing_substring(the_list, substring):
-	""" find substring in list and return it's index +1"""
+		try:
+			while True:
+				self.requests.get_nowait()
+		except queue.Empty:
+			pass
 
-	for i, string in enumerate(the_list):
-		if substring in string:
-			return i + 1 # add 1 if it's in the first so doesn't go to false
+		for reader in self.threads:
+			self.requests.put(None)
 
-	return False
+		for reader in self.threads:
+			reader.join()
 
 
-def cmd_open_write(path, mode):
-	""" Create the open/write command according to python version 
-	mode is: 'r' for read and 'w' for write
+class ParseCache(object):
+	""" Parsing of each file, shared by the targets so a file is converted once.
+	get() returns a copy, that the target can change. A file is dropped when 
+	all the targets (uses) released it 
 	"""
 
-	if PY_VER == 3:
-		return open(path, mode, encoding='utf-8-sig')
-	else:
-		return codecs.open(path, mode, encoding='utf-8-sig')
+	def __init__(self, uses):
 
+		self.uses     = uses
+		self.parsed   = dict() # path: Parsing
+		self.released = dict() # path: times released
+		self.ahead    = set()  # converted by convertAll(), counted as done (--progress)
 
-def path_find(file_path):
-	""" Find path of file """
+	def get(self, path):
+		""" Parsing of the file (a copy) """
 
-	return os.path.abspath(file_path)
+		if path not in self.parsed:
+			self.parsed[path] = Parsing(path)
 
+		return copy.copy(self.parsed[path])
 
-def path_relative_to(this_path, root=None, index=False):
-	"""Gets the relative path of this file from another path
-	root default is ouput folder 
-	"""
+	def convertAll(self, paths):
+		""" Parse the files now, converting them in worker processes (--jobs),
+		for big projects. The results are the same as parsing them one by one 
+		"""
 
-	if root is None:
-		root = CONFIG['output']
-	
-	if index:
-		return os.path.relpath(this_path, root)
-		
-	# Delete first "folder" (..\)
-	return os.path.relpath(this_path, root)[3:]
+		paths = [path for path in paths if path not in self.parsed]
 
+		# measured documents (--mem-report) are converted here. Daemon workers
+		# can't have their own
+		if CONFIG['jobs'] == 1 or CONFIG['file_timeout'] or CONFIG['profile_extensions'] or \
+				MEMORY is not None or len(paths) < PARALLEL_MIN or \
+				multiprocessing.current_process().daemon:
+			return
 
-def path_output(filepath):
-	""" Creates the output path """
-	
-	path_out = CONFIG['output']
+		workers = CONFIG['jobs'] or multiprocessing.cpu_count()
+		pool    = multiprocessing.Pool(workers, initializer=md_converter)
+		queued  = collections.deque() # (Parsing, result), in order
 
-	if not path_out:
-		newPath = path_delExtension(filepath)
-	else:
-		if CONFIG['flat'] or (not CONFIG['flat'] and filepath == CONFIG['source']):
-			newPath = os.path.join(path_out, path_delExtension(path_getFilename(filepath)))
-		else:
-			# remove first \
-			newPath = os.path.join(path_out, path_delExtension(filepath)[len(CONFIG['source']) + 1:])
+		try:
+			for path in paths:
+				page = Parsing("")
+				text = page.prepare(path, page.read(path))
+				queued.append((page, pool.apply_async(engine_job, ((text, page.extensions),))))
 
-	return newPath + ".html"
-	
+				# sources are read as the workers need them, not all up front
+				if len(queued) >= max(READ_AHEAD, workers * 4):
+					self._converted(*queued.popleft())
 
-def path_delExtension(file_path):
-	""" Delete the extension from path """
+			while queued:
+				self._converted(*queued.popleft())
+		finally:
+			pool.terminate()
+			pool.join()
 
-	path, _ = os.path.splitext(file_path)
-	return path
+	def _converted(self, page, result):
+		""" Finish the Parsing of a file converted by a worker (convertAll) """
 
+		page.mdParse(None, result.get())
+		stats_add('conversions')
 
-def path_mkdir(path):
-	""" make tree dirs from path """
+		if LINKS is not None:
+			LINKS.setTitle(page.sourcePath, page.title)
 
-	try:
-		os.makedirs(path)
-	except OSError as exc:
-		if exc.errno != errno.EEXIST:
-			raise 
+		if PROGRESS is not None:
+			PROGRESS.step(page.sourcePath)
+			self.ahead.add(page.sourcePath)
 
+		self.parsed[page.sourcePath] = page
 
-def path_get(thefile):
-	""" Get path from file """
+	def release(self, path):
+		""" A target is done with the file """
 
-	return os.path.dirname(thefile)
+		self.released[path] = self.released.get(path, 0) + 1
 
+		if path in self.ahead:
+			self.ahead.discard(path)
+		elif PROGRESS is not None:
+			PROGRESS.step(path)
 
-def path_getFilename(file_path):
-	""" Get filename from path"""
+		if self.released[path] >= self.uses:
+			self.parsed.pop(path, None)
 
-	return os.path.basename(file_path)
 
+class LinkTable(object):
+	""" Wiki links, [](file|path.md) to [title](output.html), made once per 
+	build: the files of the project by path, with their titles as they are 
+	known (parsed, or from the last build). Links are marked before the 
+	conversion and made for each target after it (render()), so the same 
+	conversion serves pages, book & merge
+	"""
 
-def path_lastDir(path):
-	""" Get last dir from path """
+	LINK   = re.compile(r'\[([^\]]*)\]\(file\|([^)#]+)(#[^)]*)?\)')
+	SCHEME = "pymd-file:"
 
-	return os.path.split(path)[1]
+	# code is left as written: spans (matched before the links), fenced and 
+	# indented blocks, besides the indented paragraphs of list items
+	INLINE = re.compile(r'(?<!\\)(`+)(?:[^\n]|\n(?![ \t]*\n))+?(?<!`)\1(?!`)|' + LINK.pattern)
+	FENCE  = re.compile(r' {0,3}(`{3,}|~{3,})')
+	INDENT = re.compile(r' {4}|\t')
+	ITEM   = re.compile(r' {0,3}([*+-]|\d+\.)[ \t]')
+	MARKED = re.compile(r'<a href="' + SCHEME + r'([^"#]*)(#[^"]*)?"([^>]*)>(</a>)?')
 
+	def __init__(self, paths, graph, cache):
 
-def files_get (elements):
-	""" Get a list of files in dir. Returns list """ 
+		self.graph  = graph
+		self.cache  = cache
+		self.files  = dict((self._key(path), path) for path in paths)
+		self.titles = dict() # path: title
 
-	theFiles = list()
+	def _key(self, path):
+		""" Same key for the different ways to write a path """
 
-	if os.path.isfile(elements):
-		if os.path.exists(elements) and elements.endswith(EXTENSIONS_ACCEPTED):
-			theFiles.append(elements)
-	else:
-		for root, subFolders, files in os.walk(elements):
-			for filename in files:
-				filePath = os.path.join(root, filename)
+		return os.path.normcase(os.path.abspath(path))
 
-				if os.path.exists(filePath) and filePath.endswith(EXTENSIONS_ACCEPTED):
-					theFiles.append(filePath)
+	def _find(self, target, source):
+		""" File linked from source: relative to its folder, or to the current
+		one. Files of the project are preferred. Returns path or None 
+		"""
 
-	return theFiles	
+		candidates = [os.path.join(path_get(source), target), target]
 
+		for path in candidates:
+			if self._key(path) in self.files:
+				return self.files[self._key(path)]
 
-def files_list(path):
-	"""Gets the files from the .list (returns list). If not a .list, calls files_get()"""
-	global CONFIG
+		for path in candidates:
+			if os.path.exists(path):
+				return os.path.normpath(path)
 
-	if path.endswith(".list"):
-		CONFIG['flat'] = True
-		fileList = list()
-		cmd      = cmd_open_write(path, 'r')
-			
-		with cmd as listFiles:
-			for line in listFiles:
-				line = line.strip()
+		return None
 
-				if line.endswith(EXTENSIONS_ACCEPTED) and os.path.exists(line):
-					fileList.append(line)
-		return fileList
-	
-	return files_get(path)
+	def setTitle(self, path, title):
+		""" Title of a file, once parsed """
 
+		self.titles[path] = title
 
-def html_cssDefault():
-	""" Default css in a big string """
+	def title(self, path):
+		""" Title of the file, parsing it only if it's unknown """
 
-	returnMe = """
-	* 			{ margin: 0; padding: 0; }
-	html, body 	{ color: black; }
-	
-	body {
-		padding: 10px 25px; max-width: 700px; margin: 5px auto; 
-	"""
+		if path not in self.titles:
+			title = self.graph.titles.get(path) or self.graph.oldTitle(path)
 
-	if CONFIG['serif']:
-		returnMe += "	font: 14px 'Droid Serif', Georgia, serif;"
-	else:
-		returnMe += "	font: 14px helvetica, arial, freesans, sans-serif;"
+			if title is None:
+				# as the page has it: meta title, h1 or its output name
+				if self._key(path) in self.files:
+					title = self.cache.get(path).title
+				else:
+					title = Parsing(path).title
 
-	returnMe += """
-	    line-height: 1.6em;
-		color: #3A3A3A;
-		background-color: #f2f2f2;
-	}
+			self.titles[path] = title
 
-	p { margin: 1em 0; }
+		return self.titles[path]
 
-	a 				  {text-decoration: none; border-bottom: 1px dotted; color: #4183c4; }
-	a:hover, a:active { color: #75A837; }
+	def _blocks(self, text):
+		""" Text split in code blocks (fenced or indented) and the rest: list 
+		of [is code, text]
+		"""
 
-	blockquote {
-		margin: 	14px 0; padding: 	0.7em 11px;
-		color: 		#555;
-		font-style: italic;
-		border-left: 10px solid #838383;
-	}
+		parts    = list()
+		fence    = None  # opening fence of the block
+		blank    = True  # previous line
+		indented = False # in an indented block
+		listed   = False # in a list, indented lines belong to its items
 
-	img {
-		display: 		  block;
-		background-color: #F3F3F2;
-		border: 		  1px solid #D9D9D7;
+		for line in text.splitlines(True):
+			opening = self.FENCE.match(line)
+			empty   = not line.strip()
+
+			if fence is not None:
+				code = True
+
+				if opening and opening.group(1)[0] == fence[0] and len(opening.group(1)) >= len(fence) \
+						and not line[opening.end():].strip():
+					fence = None
+			elif opening:
+				fence, code, indented = opening.group(1), True, False
+			elif empty:
+				code = False
+			else:
+				indented = bool(self.INDENT.match(line)) and (blank or indented) and not listed
+				code     = indented
+
+				if self.ITEM.match(line):
+					listed = True
+				elif blank and not self.INDENT.match(line):
+					listed = False
+
+			blank = empty
+
+			if parts and parts[-1][0] == code:
+				parts[-1][1] += line
+			else:
+				parts.append([code, line])
+
+		return parts
+
+	def mark(self, text, source):
+		""" Mark the wiki links in text (of source) to the files found, for 
+		render(). Returns the text and the linked files
+		"""
+
+		if "](file|" not in text:
+			return text, []
+
+		linked = list()
+
+		def replace(match):
+			ticks, label, target, anchor = match.groups()
+
+			if ticks:
+				# code span
+				return match.group(0)
+
+			path = self._find(target, source)
+
+			if path is None:
+				# not found, as written
+				return "[" + (label or target) + "](" + path_delExtension(target) + ".html" + \
+						(anchor or "") + ")"
+
+			linked.append(path)
+
+			return "[" + label + "](" + self.SCHEME + url_quote(path) + (anchor or "") + ")"
+
+		text = "".join(part if code else self.INLINE.sub(replace, part)
+						for code, part in self._blocks(text))
+
+		return text, sorted(set(linked))
+
+	def render(self, html, outputPath, chapters=None):
+		""" Make the marked links of html, saved to outputPath: relative to it,
+		or to the anchors of the chapters merged in it, {path: (article id, 
+		renamed ids)}. Empty labels are the titles of the files 
+		"""
+
+		if self.SCHEME not in html:
+			return html
+
+		folder   = path_get(outputPath) or os.curdir
+		chapters = chapters or {}
+
+		def replace(match):
+			quoted, anchor, attributes, empty = match.groups()
+			path = url_unquote(quoted)
+
+			if path in chapters:
+				article, renamed = chapters[path]
+				href = "#" + (renamed.get(anchor[1:], anchor[1:]) if anchor else article)
+			else:
+				href = os.path.relpath(path_output(path), folder).replace(os.sep, '/') + (anchor or "")
+
+			link = '<a href="' + href + '"' + attributes + '>'
+
+			return link + self.title(path) + empty if empty else link
+
+		return self.MARKED.sub(replace, html)
+
+
+class ConvertTimeout(Exception):
+	""" A conversion took longer than --file-timeout """
+
+
+class ConvertDied(ConvertTimeout):
+	""" The worker process died during a conversion (killed, out of memory, 
+	crashed): handled as a timeout 
+	"""
+
+
+class ConvertWorker(object):
+	""" Process that converts markdown for this one (--file-timeout), so a 
+	document taking too long is killed without stopping the build. It keeps
+	running between documents, a new one is started after a kill 
+	"""
+
+	def __init__(self):
+
+		self.process    = None
+		self.connection = None
+
+	def start(self):
+		""" Start the worker process """
+
+		if multiprocessing.current_process().daemon:
+			raise RuntimeError("--file-timeout needs child processes, not available here (daemon)")
+
+		self.connection, child = multiprocessing.Pipe()
+
+		self.process = multiprocessing.Process(target=isolated_main, args=(child,))
+		self.process.daemon = True
+		self.process.start()
+
+		child.close()
+
+	def stop(self):
+		""" Kill the worker """
+
+		self.process.terminate()
+		self.process.join()
+		self.connection.close()
+
+		self.process = None
+
+	def convert(self, text, timeout, extensions=None):
+		""" Returns engine_run() of text, or raises ConvertTimeout after timeout
+		seconds (ConvertDied if the worker dies first)
+		"""
+
+		if self.process is None:
+			self.start()
+
+		try:
+			self.connection.send((text, extensions))
+
+			if not self.connection.poll(timeout):
+				self.stop()
+				raise ConvertTimeout()
+
+			result, error = self.connection.recv()
+		except (EOFError, IOError, OSError):
+			# its end of the pipe closed: a new worker for the next document
+			self.stop()
+			raise ConvertDied()
+
+		if error:
+			raise RuntimeError(error)
+
+		return result
+
+
+class DepGraph(object):
+	""" Inputs each output was built from, persisted between builds.
+
+	An output depends on the content of some files (its source, the header,
+	the custom index) and only on the title of others (book neighbours, wiki
+	linked files), so a title change doesn't rebuild every page.
+	"""
+
+	VERSION = 2 # outputs saved relative to the output folder
+
+	# options that change the outputs: if any does, everything is dirty
+	OPTIONS = ('flat', 'header', 'extensions', 'css', 'serif', 'toc', 'index', 
+				'nav', 'template', 'assets', 'engine')
+
+	def __init__(self, path=None):
+
+		self.path    = path # None: nothing is saved or loaded (no --output)
+		self.root    = CONFIG['output'] or "" # outputs are made from it
+		self.inputs  = dict() # path: fingerprint, this build
+		self.stats   = dict() # path: [size, mtime] of the fingerprint
+		self.titles  = dict() # path: title, this build
+		self.outputs = dict() # output: {'content': [paths], 'titles': [paths]}
+		self.old     = {'inputs': {}, 'titles': {}, 'outputs': {}}
+		self.source  = CONFIG['source']
+		self.layout  = {'targets': CONFIG['targets'], 'flat': CONFIG['flat']}
+		self.options = self._options()
+		self.rebuild = False # the options changed since the last build
+
+		if path is not None and os.path.exists(path):
+			try:
+				with open(path, 'r') as depsFile:
+					old = json.load(depsFile)
+
+				# older files: everything is dirty
+				if old.get('version') == self.VERSION:
+					old['outputs'] = self._moved(old['outputs'], 
+										lambda output: os.path.join(self.root, output))
+					self.old = old
+					self.rebuild = old.get('options') != self.options
+			except ValueError:
+				pass # broken file, everything is dirty
+
+	def _options(self):
+		""" Fingerprint of the OPTIONS of this build and the template content """
+
+		options = dict((key, CONFIG[key]) for key in self.OPTIONS)
+
+		if CONFIG['template'] and os.path.exists(CONFIG['template']):
+			options['template_content'] = file_hash(CONFIG['template'])
+
+		text = json.dumps(options, sort_keys=True)
+
+		return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+	def _moved(self, outputs, move):
+		""" outputs (and their assets) with the paths changed by move(path). The 
+		saved ones are relative, so the output folder can move (--atomic)
+		"""
+
+		moved = dict()
+
+		for output, edges in outputs.items():
+			edges = dict(edges)
+
+			if 'assets' in edges:
+				edges['assets'] = [move(dest) for dest in edges['assets']]
+
+			moved[move(output)] = edges
+
+		return moved
+
+	def fingerprint(self, path):
+		""" Hash of the file content (cached for this build). If size and 
+		mtime are the ones of the last build, its hash is reused 
+		"""
+
+		if path not in self.inputs:
+			info = os.stat(path)
+			self.stats[path] = [info.st_size, info.st_mtime]
+
+			if self.old.get('stats', {}).get(path) == self.stats[path] and path in self.old['inputs']:
+				self.inputs[path] = self.old['inputs'][path]
+			else:
+				self.inputs[path] = file_hash(path)
+
+		return self.inputs[path]
+
+	def changed(self, path):
+		""" True if the file content changed since the last build """
+
+		if not os.path.exists(path):
+			return True
+
+		return self.fingerprint(path) != self.old['inputs'].get(path)
+
+	def oldTitle(self, path):
+		""" Title of the file in the last build, if it didn't change. Else None """
+
+		if self.rebuild or self.changed(path):
+			return None
+
+		return self.old['titles'].get(path)
+
+	def setTitle(self, path, title):
+		""" Record the title of a file in this build """
+
+		self.titles[path] = title
+
+	def add(self, output, content, titles=()):
+		""" Record the edges of an output. It keeps the wiki links of the last
+		build until setLinks(), they don't change if the content doesn't 
+		"""
+
+		old = self.old['outputs'].get(output, {})
+
+		self.outputs[output] = {'content': list(content), 'titles': list(titles), 
+								'links': old.get('links', [])}
+
+	def setLinks(self, output, links):
+		""" Record the files the output wiki links to (depends on their titles) """
+
+		self.outputs[output]['links'] = sorted(set(links))
+
+	def drop(self, output):
+		""" The output isn't made by this build after all """
+
+		self.outputs.pop(output, None)
+
+	def setTimedOut(self, output):
+		""" The output has a placeholder (--file-timeout), rebuild it next time """
+
+		self.outputs[output]['timedOut'] = True
+
+	def addAssets(self, output, assets):
+		""" Record the assets (source, destination) an output links to """
+
+		known = self.outputs[output].get('assets', [])
+		self.outputs[output]['assets'] = sorted(set(known) | set(dest for _, dest in assets))
+
+		for source, dest in assets:
+			self.outputs[dest] = {'content': [source], 'titles': []}
+
+	def oldAssets(self, output):
+		""" Assets (source, destination) of the output in the last build """
+
+		old = self.old['outputs']
+
+		return [(old[dest]['content'][0], dest) 
+					for dest in old.get(output, {}).get('assets', []) if dest in old]
+
+	def isDirty(self, output, content, titles=()):
+		""" True if the output is missing, its edges changed or any input did """
+
+		old = self.old['outputs'].get(output)
+
+		if self.rebuild or old is None or old.get('timedOut') or not os.path.exists(output):
+			return True
+
+		if old['content'] != list(content) or old['titles'] != list(titles):
+			return True
+
+		for path in content:
+			if self.changed(path):
+				return True
+
+		for path in list(titles) + old.get('links', []):
+			if path in self.titles:
+				if self.titles[path] != self.old['titles'].get(path):
+					return True
+			elif self.changed(path):
+				return True
+
+		return False
+
+	def stale(self):
+		""" Outputs of the last build not made by this one. Only when it was 
+		built the same way (source, targets, flat): other targets aren't stale
+		"""
+
+		if self.old.get('source') != self.source or self.old.get('layout') != self.layout:
+			return []
+
+		return sorted(set(self.old['outputs']) - set(self.outputs))
+
+	def save(self):
+		""" Persist the graph for the next build """
+
+		if self.path is None:
+			return
+
+		for edges in self.outputs.values():
+			for path in edges['content'] + edges['titles'] + edges.get('links', []):
+				if os.path.exists(path):
+					self.fingerprint(path)
+
+		outputs = self._moved(self.outputs, 
+						lambda output: os.path.relpath(output, self.root or os.curdir))
+
+		data = {'inputs': self.inputs, 'titles': self.titles, 'outputs': outputs, 
+				'source': self.source, 'layout': self.layout, 'options': self.options, 
+				'stats': self.stats, 'version': self.VERSION}
+
+		path_mkdir(path_get(self.path))
+
+		text = json.dumps(data, indent=1, sort_keys=True)
+		file_replace(self.path, text.encode('utf-8'))
+
+
+class OutputChanges(object):
+	""" Outputs added, modified or deleted by a build, so deploys only sync those """
+
+	def __init__(self):
+
+		self.changes = list() # (status, path). Status: A added, M modified, D deleted
+
+	def record(self, status, path):
+		""" Record a changed output """
+
+		self.changes.append((status, path))
+
+	def save(self, path, root):
+		""" Write the list: a line per output, status and path (relative to root) """
+
+		lines = [status + "\t" + os.path.relpath(output, root) + "\n" 
+					for status, output in self.changes]
+
+		path_mkdir(path_get(os.path.abspath(path)))
+
+		# no BOM, it's read by sync scripts
+		file_replace(path, "".join(lines).encode('utf-8'))
+
+
+class AssetMirror(object):
+	""" Local files (images, attachments...) linked from the pages, mirrored
+	in the output tree. The links are rewritten to the mirrored path, files
+	with the same content are mirrored once. Files in the source folder keep 
+	their place in the tree, others go to ASSETS_FOLDER
+	"""
+
+	LINK = re.compile(r'(\s(?:src|href)=")([^"]*)(")')
+
+	def __init__(self, graph):
+
+		self.graph  = graph
+		self.byHash = dict() # hash: destination, this build
+		self.done   = set()  # destinations mirrored, this build
+
+		source = os.path.abspath(CONFIG['source'])
+		self.root = source if os.path.isdir(source) else path_get(source)
+
+	def rewrite(self, page, outputPath):
+		""" Mirror the assets of the page (Parsing) and point its links to them. 
+		outputPath is where the page is saved 
+		"""
+
+		assets   = list()
+		page_dir = path_get(page.sourcePath)
+		out_dir  = path_get(outputPath)
+
+		def relink(match):
+			url    = match.group(2)
+			source = asset_source(url, page_dir)
+
+			if source is None:
+				return match.group(0)
+
+			dest = self.destination(source)
+
+			if os.path.abspath(dest) == source:
+				return match.group(0) # already in place
+
+			self.mirror(source, dest)
+			assets.append((source, dest))
+
+			url_path, suffix = asset_split(url)
+			new_url = url_quote(os.path.relpath(dest, out_dir or os.curdir).replace(os.sep, '/'))
+
+			return match.group(1) + new_url + suffix + match.group(3)
+
+		page.html = self.LINK.sub(relink, page.html)
+		self.graph.addAssets(outputPath, assets)
+
+	def carry(self, outputPath):
+		""" Keep the assets of a page that isn't rebuilt (--incremental) """
+
+		assets = [(source, dest) for source, dest in self.graph.oldAssets(outputPath) 
+					if os.path.isfile(source)]
+
+		for source, dest in assets:
+			self.mirror(source, dest)
+
+		self.graph.addAssets(outputPath, assets)
+
+	def destination(self, source):
+		""" Output path of the asset. The first with the same content, if any """
+
+		digest = self.graph.fingerprint(source)
+
+		if digest not in self.byHash:
+			relative = os.path.relpath(source, self.root)
+
+			if relative.startswith(os.pardir):
+				relative = os.path.join(ASSETS_FOLDER, digest[:10] + "-" + path_getFilename(source))
+
+			self.byHash[digest] = os.path.join(CONFIG['output'], relative)
+
+		return self.byHash[digest]
+
+	def mirror(self, source, dest):
+		""" Make dest a copy of source, unless it's already there """
+
+		if dest in self.done:
+			return
+
+		self.done.add(dest)
+
+		if os.path.exists(dest):
+			if os.path.samefile(source, dest):
+				return # hardlinked
+
+			if dest in self.graph.old['outputs'] and not self.graph.changed(source):
+				return # copied before, unchanged
+
+			status = 'M'
+		else:
+			status = 'A'
+
+		file_link(source, dest)
+
+		if CHANGES is not None:
+			CHANGES.record(status, dest)
+
+
+class MemReport(object):
+	""" Peak memory of each document & stage: the peak RSS of the process 
+	while it ran, and how much it raised the peak of the whole process (RSS 
+	rarely goes down, so the growth would be 0 for most, and the peak is 
+	the one of everything before too). A thread samples it, so peaks in the
+	middle are seen too 
+	"""
+
+	INTERVAL = 0.005 # seconds between samples
+
+	def __init__(self, budget=0):
+
+		self.budget  = budget * 1024 * 1024 # bytes the process peak rises, 0: no budget
+		self.peaks   = list()  # (bytes, kind, name, bytes the process peak rose)
+		self.active  = dict()  # measures running: [start, peak]
+		self.lock    = threading.Lock()
+		self.running = True
+		self.sampler = threading.Thread(target=self._sample)
+		self.sampler.daemon = True
+		self.sampler.start()
+
+	def _sample(self):
+		""" Sampler thread """
+
+		while self.running:
+			self._update(mem_current())
+			time.sleep(self.INTERVAL)
+
+	def _update(self, current):
+		""" Raise the peak of the running measures """
+
+		with self.lock:
+			for values in self.active.values():
+				values[1] = max(values[1], current)
+
+	@contextlib.contextmanager
+	def measure(self, kind, name):
+		""" Measure the block, as a kind (document, stage) named name """
+
+		key     = object()
+		current = mem_current()
+		high    = mem_high()
+
+		with self.lock:
+			self.active[key] = [current, current]
+
+		try:
+			yield
+		finally:
+			self._update(mem_current())
+
+			with self.lock:
+				start, peak = self.active.pop(key)
+
+			self.record(kind, name, peak, mem_high() - high)
+
+	def record(self, kind, name, size, raised=0):
+		""" Save a peak, warning if a document raised the process peak over 
+		budget (its own peak includes what the documents before it took)
+		"""
+
+		self.peaks.append((size, kind, name, raised))
+
+		if self.budget and kind == 'document' and raised > self.budget:
+			print ("    warning: %s raised the memory peak by %.2f MB, over the %.2f MB budget" % 
+					(name, mem_mb(raised), mem_mb(self.budget)))
+
+	def stop(self):
+		""" Stop sampling """
+
+		self.running = False
+		self.sampler.join()
+
+	def report(self, top):
+		""" Print the top consumers """
+
+		# the ones that raised the process peak first, they took the memory
+		print ("\n    memory, peak RSS while running (raise of the process peak):")
+
+		for size, kind, name, raised in sorted(self.peaks, key=lambda peak: (-peak[3], -peak[0]))[:top]:
+			print ("      %-9s %8.1f MB  (+%.1f MB)  %s" % (kind, mem_mb(size), mem_mb(raised), name))
+
+
+class ExtensionProfile(object):
+	""" Time spent in the processors of each extension (--profile-extensions).
+	The processors of the Markdown instances are wrapped to time them; a 
+	processor's time doesn't include the ones it calls (inline patterns run
+	inside the inline treeprocessor). Processors are told apart from the core
+	ones by making a Markdown instance with each extension alone 
+	"""
+
+	CORE   = "(core)"
+	STAGES = ('pre', 'block', 'inline', 'tree', 'post')
+
+	def __init__(self):
+
+		self.times   = dict() # (extension, stage): seconds
+		self.running = list() # time of the children of the processors running
+		self.owners  = dict() # extension: {(stage, name): class}
+		self.start   = time.time()
+
+	def _registries(self, md):
+		""" Processors of the instance by stage: {stage: [(name, processor)]} """
+
+		registries = {'pre': md.preprocessors, 'block': md.parser.blockprocessors, 
+					  'inline': md.inlinePatterns, 'tree': md.treeprocessors, 
+					  'post': md.postprocessors}
+
+		for stage, registry in registries.items():
+			data = getattr(registry, '_data', None) # markdown 3: Registry
+			registries[stage] = list(data.items() if data is not None else registry.items())
+
+		return registries
+
+	def _classes(self, extensions):
+		""" Classes of the processors of a Markdown instance with extensions """
+
+		try:
+			md = markdown.Markdown(extensions=extensions, output_format="html5")
+		except Exception:
+			return dict() # needs other extensions
+
+		return dict(((stage, name), type(processor)) 
+					for stage, items in self._registries(md).items() for name, processor in items)
+
+	def owner(self, stage, name, processor):
+		""" Extension that added (or replaced) a processor """
+
+		if self.CORE not in self.owners:
+			self.owners[self.CORE] = self._classes([])
+
+		for extension, classes in self.owners.items():
+			if extension != self.CORE and classes.get((stage, name)) is type(processor) and \
+					self.owners[self.CORE].get((stage, name)) is not type(processor):
+				return extension
+
+		if self.owners[self.CORE].get((stage, name)) is type(processor):
+			return self.CORE
+
+		return type(processor).__module__.split('.')[-1]
+
+	def instrument(self, md, extensions):
+		""" Time the processors of a new Markdown instance """
+
+		for extension in extensions:
+			if extension not in self.owners:
+				self.owners[extension] = self._classes([extension])
+
+		for stage, items in self._registries(md).items():
+			for name, processor in items:
+				key = (self.owner(stage, name, processor).split('.')[-1], stage)
+
+				if stage == 'block':
+					processor.test = self._timed(key, processor.test)
+					processor.run  = self._timed(key, processor.run)
+				elif stage == 'inline':
+					processor.handleMatch = self._timed(key, processor.handleMatch)
+					processor.compiled_re = _TimedRegex(processor.compiled_re, key, self)
+				else:
+					processor.run = self._timed(key, processor.run)
+
+	def _timed(self, key, function):
+		""" function, adding its own time to key """
+
+		def timed(*args, **kwargs):
+			start = time.time()
+			self.running.append(0.0)
+
+			try:
+				return function(*args, **kwargs)
+			finally:
+				self.add(key, time.time() - start)
+
+		return timed
+
+	def add(self, key, elapsed):
+		""" Add the time of a processor that ended (without its children) """
+
+		children = self.running.pop()
+		self.times[key] = self.times.get(key, 0) + elapsed - children
+
+		if self.running:
+			self.running[-1] += elapsed
+
+	def report(self, documents):
+		""" Print the time of each extension, by stage """
+
+		total = time.time() - self.start
+		rows  = dict() # extension: {stage: seconds}
+
+		for (extension, stage), seconds in self.times.items():
+			rows.setdefault(extension, dict())[stage] = seconds
+
+		print ("\n    extensions, time in their processors (%d conversions, %.2f s build):" % (documents, total))
+		print ("      %-14s %8s %6s  " % ("extension", "seconds", "%") + 
+				"".join("%8s" % stage for stage in self.STAGES))
+
+		for extension, stages in sorted(rows.items(), key=lambda row: -sum(row[1].values())):
+			seconds = sum(stages.values())
+
+			print ("      %-14s %8.3f %6.1f  " % (extension, seconds, 100 * seconds / total) + 
+					"".join("%8.3f" % stages.get(stage, 0) for stage in self.STAGES))
+
+
+class _TimedRegex(object):
+	""" Compiled regex of an inline pattern, timing its matches (ExtensionProfile) """
+
+	def __init__(self, regex, key, profile):
+
+		self.regex   = regex
+		self.key     = key
+		self.profile = profile
+
+	def __getattr__(self, name):
+		return getattr(self.regex, name)
+
+	def match(self, *args):
+		start = time.time()
+		self.profile.running.append(0.0)
+
+		try:
+			return self.regex.match(*args)
+		finally:
+			self.profile.add(self.key, time.time() - start)
+
+	def search(self, *args):
+		start = time.time()
+		self.profile.running.append(0.0)
+
+		try:
+			return self.regex.search(*args)
+		finally:
+			self.profile.add(self.key, time.time() - start)
+
+
+class Progress(object):
+	""" Files done (a file for each target) of a build, with speed & ETA, 
+	shown in stderr as a line (tty) or JSON lines (json). It's shown every 
+	INTERVAL seconds at most, so a step only counts 
+	"""
+
+	INTERVAL = {'tty': 0.2, 'json': 1.0} # seconds between updates
+
+	def __init__(self, total, style):
+
+		self.total   = total
+		self.style   = style
+		self.done    = 0
+		self.size    = 0 # bytes of the files done
+		self.current = ""
+		self.start   = time.time()
+		self.next    = self.start
+
+	def step(self, path):
+		""" A file is done """
+
+		self.done   += 1
+		self.current = path
+
+		try:
+			self.size += os.path.getsize(path)
+		except OSError:
+			pass
+
+		now = time.time()
+
+		if now >= self.next:
+			self.next = now + self.INTERVAL[self.style]
+			self.show(now)
+
+	def show(self, now):
+		""" Print the progress """
+
+		elapsed = max(now - self.start, 0.001)
+		speed   = self.done / elapsed
+		eta     = (self.total - self.done) / speed if speed else 0
+
+		if self.style == 'json':
+			line = json.dumps({'done': self.done, 'total': self.total, 
+								'files_s': round(speed, 2), 'mb_s': round(mem_mb(self.size) / elapsed, 3), 
+								'eta_s': round(eta, 1), 'elapsed_s': round(elapsed, 1), 
+								'current': self.current}, sort_keys=True) + "\n"
+		else:
+			line = "\r    %d/%d files  %.1f files/s  %.2f MB/s  ETA %d:%02d  %s" % (self.done, 
+						self.total, speed, mem_mb(self.size) / elapsed, eta // 60, eta % 60, self.current)
+			line = line[:79].ljust(79)
+
+		sys.stderr.write(line)
+		sys.stderr.flush()
+
+	def finish(self):
+		""" Show the last state """
+
+		self.show(time.time())
+
+		if self.style == 'tty':
+			sys.stderr.write("\n")
+
+
+class PageTemplate(object):
+	""" Page layout compiled to a list of text & slots ({{name}}), so a page 
+	is made by filling the slots and joining. Slots in static (same for all 
+	pages, like css) are joined into the text when compiled 
+	"""
+
+	SLOT = re.compile(r'\{\{\s*(\w+)\s*\}\}')
+
+	def __init__(self, text, static):
+
+		pieces = self.SLOT.split(text) # text, slot, text, slot... text
+		chunk  = pieces[0]
+
+		self.parts = list() # text, slot, text... slots in odd positions
+
+		for i in range(1, len(pieces), 2):
+			if pieces[i] in static:
+				chunk += static[pieces[i]] + pieces[i + 1]
+			else:
+				self.parts.append(chunk)
+				self.parts.append(pieces[i])
+				chunk = pieces[i + 1]
+
+		self.parts.append(chunk)
+
+	def render(self, values):
+		""" Returns the page with the slots filled from values (dict) """
+
+		parts = list(self.parts)
+
+		for i in range(1, len(parts), 2):
+			parts[i] = values.get(parts[i], "")
+
+		return "".join(parts)
+
+
+class InputExist(argparse.Action):
+	""" Custom action for args, check if input exists """
+
+	def __call__(self, parser, namespace, values, option_string=None):
+		if values not in (None, STDIN_SOURCE) and not os.path.exists(values):
+			parser.error('Source file or folder doesn\'t exist')
+
+		setattr(namespace, self.dest, values)
+
+
+class OptionsBelong(argparse.Action):
+	""" Custom action for args, check 'belonging' of options """
+
+	def __call__(self, parser, namespace, values, option_string=None):
+
+		targets = namespace.targets or ""
+
+		if option_string == "--toc" and namespace.merge is False and 'merge' not in targets:
+			parser.error('--toc belongs to --merge')
+
+		if option_string in ["--index", "--nav"] and namespace.book is False and 'book' not in targets:
+			parser.error(option_string + ' belongs to --book')
+
+		if option_string == "--nav" or option_string == "-n":
+			values = True
+
+		setattr(namespace, self.dest, values)
+
+# ---------------------
+# Methods 
+# ---------------------
+
+def args(argv=None):
+	""" Arguments definition (of argv, default: command line). Returns values as dict """
+
+	if argv is None:
+		argv = sys.argv[1:]
+
+	# to allow --merge to be merge and still being optional
+	subcat_args = ('merge','book')
+	arguments   = ['--' + arg if arg in subcat_args else arg for arg in argv]
+
+	# definitions:
+	parser = argparse.ArgumentParser(
+							formatter_class=argparse.RawTextHelpFormatter, 
+							add_help=False, usage=MY_USAGE, 
+							description=MY_DESCRIPTION, epilog=MY_EPILOG
+							)
+
+	group_required = parser.add_argument_group(' Required')
+
+	group_required.add_argument("source"
+						, help="File, folder or .list (mainly used with merge or book). \n"
+							   "- reads markdown from stdin and writes the page to stdout"
+						, nargs='?', action=InputExist)
+
+	group_options = parser.add_argument_group(' Options')
+	
+	group_options.add_argument("--output", "-o" 
+						, help="Output folder to save processed files"
+						, metavar='FOLDER')
+	group_options.add_argument("--flat"
+						, help="Save files in a single directory depth"
+						, action="store_true")
+	group_options.add_argument("--header"
+						, help="Header file, mainly for merged. Could contain title, date and toc (as [TOC_HERE])."
+						, metavar='FILE')
+	group_options.add_argument("--extensions"
+						, help="List of other installed extensions"
+						, nargs='*', metavar='ext')
+
+	group_options.add_argument("--engine"
+						, help="Markdown converter. mistune is faster but has less features \n"
+							   "(see perf/parity.py) and no --extensions. Default: %(default)s"
+						, default='markdown', choices=list(ENGINES))
+
+	group_options.add_argument("--template"
+						, help="Page template file. Slots: {{title}}, {{css}}, {{meta}}, {{body}}"
+						, metavar='FILE')
+
+	exclusive_css = group_options.add_mutually_exclusive_group()
+	exclusive_css.add_argument("--css"
+						, help="Custom css with path (as included in href). Default: embeded"
+						, metavar='FILE')
+	exclusive_css.add_argument("--serif"
+						, help="(embeded CSS) pick sans (false) or serif (true). Default: %(default)s"
+						, action='store_true')	
+
+	group_special = parser.add_argument_group(' Specific')
+
+	exclusive_style = group_special.add_mutually_exclusive_group()
+	exclusive_style.add_argument("--merge"
+						, help="Merge files into one."
+						, action="store_true")
+	group_special.add_argument  ("--toc", choices = [0, 1, 2, 3, 4, 5] 
+						, help="Toc max depth (for [TOC_HERE]). Default: %(default)s (all)"
+						, default=0 , type=int, action=OptionsBelong)
+	exclusive_style.add_argument("--book"
+						, help="Create a book with navigation (next/prev) between files and an index"
+						, action="store_true")
+	group_special.add_argument  ("--targets"
+						, help="Make several of pages, merge & book (comma separated) from a single \n"
+							   "conversion of the files. With book and others, the book goes in \n"
+							   "FOLDER/" + BOOK_FOLDER + ". Put it before --toc, --index and --nav"
+						, metavar='LIST')
+	group_special.add_argument  ("--index"
+						, help="Custom index for book"
+						, action=OptionsBelong , metavar='FILE')
+	group_special.add_argument  ("--nav", "-n"
+						, help='Use file titles as the navigation links instead of "prev/next"'
+						, default=False, nargs=0, action=OptionsBelong)
+
+	group_build = parser.add_argument_group(' Build')
+	group_build.add_argument("--atomic"
+						, help="(with -o) Build in a staging copy of the output (hardlinks) and \n"
+							   "publish it at once: the output becomes a symlink to the build"
+						, action="store_true")
+	group_build.add_argument("--incremental"
+						, help="(with -o) Only rebuild the outputs whose inputs (sources, header, neighbours' \n"
+							   "titles, linked files) changed since the last build"
+						, action="store_true")
+
+	group_build.add_argument("--assets"
+						, help="(with -o) Mirror local files linked from the pages (images...) in \n"
+							   "the output folder, hardlinked when possible, and fix the links"
+						, action="store_true")
+	group_build.add_argument("--progress"
+						, help="Show the files done, speed, ETA & current file (in stderr): \n"
+							   "as a line (tty) or JSON lines (json). Default: %(const)s"
+						, nargs='?', const='tty', choices=['tty', 'json'])
+	group_build.add_argument("--profile-extensions"
+						, help="Report the time spent in each extension (its pre, block, inline, \n"
+							   "tree & post processors). Converts in this process"
+						, action="store_true")
+	group_build.add_argument("--mem-report"
+						, help="Report the peak memory of each document & stage (top N). Default: %(const)s"
+						, nargs='?', const=10, type=int, metavar='N')
+	group_build.add_argument("--mem-budget"
+						, help="Warn when a document raises the memory peak by more than MB"
+						, default=0, type=float, metavar='MB')
+	group_build.add_argument("--file-timeout"
+						, help="Convert each file in a separate process, killing it after SECONDS \n"
+							   "(not in the daemon: with --connect, the build runs here)"
+						, default=0, type=float, metavar='SECONDS')
+	group_build.add_argument("--on-timeout"
+						, help="(--file-timeout) What to do with a file that was killed: \n"
+							   "save a placeholder page or skip it. Default: %(default)s"
+						, default='placeholder', choices=['placeholder', 'skip'])
+	group_build.add_argument("--batch"
+						, help="(stdin) Read many documents and write the pages back in order. \n"
+							   "nul: documents end with NUL; length: each document is preceded \n"
+							   "by its length in bytes and a newline. Default: %(const)s"
+						, nargs='?', const='nul', choices=['nul', 'length'])
+	group_build.add_argument("--jobs", "-j"
+						, help="Worker processes (daemon, converting big books & merges). \n"
+							   "1: convert in this one. Default: one per CPU"
+						, default=0, type=int, metavar='N')
+
+	group_daemon = parser.add_argument_group(' Daemon')
+	group_daemon.add_argument("--daemon"
+						, help="Serve render & build requests (JSON) on a unix socket, \n"
+							   "keeping the converters loaded. No SOURCE needed"
+						, metavar='SOCKET')
+	group_daemon.add_argument("--connect"
+						, help="Forward this invocation to the daemon listening on SOCKET; \n"
+							   "if it isn't running, build here. Default: $" + DAEMON_ENV
+						, default=os.environ.get(DAEMON_ENV), metavar='SOCKET')
+
+	group_other = parser.add_argument_group(' Last but not least')
+	group_other.add_argument("--help", "-h", 
+						help="show this help message and exit", action="help") 
+
+	values = vars(parser.parse_args(arguments))
+
+	if not values['source'] and not values['daemon']:
+		parser.error('SOURCE is required')
+
+	if values['targets']:
+		values['targets'] = [target.strip() for target in values['targets'].split(',') if target.strip()]
+
+		for target in values['targets']:
+			if target not in TARGETS:
+				parser.error('unknown target: ' + target + '. Targets: ' + ', '.join(TARGETS))
+
+		if 'pages' in values['targets'] and 'book' in values['targets'] and not values['output']:
+			parser.error('pages and book need --output')
+	else:
+		values['targets'] = ['book'] if values['book'] else ['merge'] if values['merge'] else ['pages']
+
+	values['merge'] = 'merge' in values['targets']
+	values['book']  = 'book' in values['targets']
+
+	if values['batch'] and values['source'] != STDIN_SOURCE:
+		parser.error('--batch reads from stdin, use ' + STDIN_SOURCE + ' as source')
+
+	if values['daemon'] and values['file_timeout']:
+		parser.error('--file-timeout isn\'t available with --daemon, its workers can\'t start processes')
+
+	if values['incremental'] and not values['output']:
+		parser.error('--incremental needs --output, the last build is recorded next to it')
+
+	return values
+
+
+def index_containing_substring(the_list, substring):
+	""" find substring in list and return it's index +1"""
+
+	for i, string in enumerate(the_list):
+		if substring in string:
+			return i + 1 # add 1 if it's in the first so doesn't go to false
+
+	return False
+
+
+def cmd_open_write(path, mode):
+	""" Create the open/write command according to python version 
+	mode is: 'r' for read and 'w' for write
+	"""
+
+	if PY_VER == 3:
+		return open(path, mode, encoding='utf-8-sig')
+	else:
+		return codecs.open(path, mode, encoding='utf-8-sig')
+
+
+def md_converter(extensions=None):
+	""" Markdown instance of this thread (for extensions, default: all). 
+	Created once, reset between documents 
+	"""
+
+	if extensions is None:
+		extensions = SELECTED_EXTENSIONS + (CONFIG['extensions'] or [])
+
+	cache = getattr(CONVERTERS, 'md', None)
+
+	if cache is None:
+		cache = CONVERTERS.md = dict()
+
+	md = cache.get(tuple(extensions))
+
+	if md is None:
+		md = markdown.Markdown(
+						extensions=extensions, 
+						output_format="html5")
+		cache[tuple(extensions)] = md
+
+		if PROFILE is not None:
+			PROFILE.instrument(md, extensions)
+	else:
+		md.reset()
+
+		# abbr adds a pattern for each abbreviation and reset() keeps them
+		for key in [key for key in md.inlinePatterns.keys() if key.startswith('abbr-')]:
+			del md.inlinePatterns[key]
+
+	return md
+
+
+def md_extensions(path):
+	""" Extensions for the file: all, changed by the profile of its folder (the
+	nearest _extensions in the source) and of the .list 
+	"""
+
+	extensions = SELECTED_EXTENSIONS + (CONFIG['extensions'] or [])
+	changes    = profile_folder(path_get(os.path.abspath(path)))[0] + CONFIG['list_extensions']
+
+	for change in changes:
+		name = change.lstrip('+-')
+
+		if change.startswith('-'):
+			extensions = [ext for ext in extensions if ext != name]
+		elif name not in extensions:
+			extensions.append(name)
+
+	return extensions
+
+
+def profile_folder(folder):
+	""" Extensions profile of the folder: its _extensions file, else the one 
+	of its parent, up to the source folder. Returns changes (-name, +name) 
+	& the profile file (None if there isn't)
+	"""
+
+	if folder not in PROFILES:
+		source = os.path.abspath(CONFIG['source'])
+		source = source if os.path.isdir(source) else path_get(source)
+		path   = os.path.join(folder, EXTENSIONS_FILENAME)
+		parent = path_get(folder)
+
+		if os.path.exists(path):
+			PROFILES[folder] = (profile_read(path), path)
+		elif folder.startswith(source + os.sep) and parent != folder:
+			PROFILES[folder] = profile_folder(parent)
+		else:
+			PROFILES[folder] = ([], None)
+
+	return PROFILES[folder]
+
+
+def profile_deps(paths):
+	""" Profile files (_extensions) used by the files, for the dependencies """
+
+	deps = list()
+
+	for path in paths:
+		profile = profile_folder(path_get(os.path.abspath(path)))[1]
+
+		if profile and profile not in deps:
+			deps.append(profile)
+
+	return deps
+
+
+def profile_read(path):
+	""" Extension changes of a profile: names, -name to remove, +name (or name)
+	to add; separated by spaces, commas or lines. # starts a comment 
+	"""
+
+	changes = list()
+
+	with cmd_open_write(path, 'r') as profileFile:
+		for line in profileFile:
+			changes += line.split('#')[0].replace(',', ' ').split()
+
+	return changes
+
+
+def md_run(text, extensions=None):
+	""" Convert markdown text. Returns html, toc & meta (dict) """
+
+	md   = md_converter(extensions)
+	html = md.convert(text)
+
+	# save toc not especified in document
+	return html, getattr(md, 'toc', ""), getattr(md, 'Meta', {})
+
+
+def mistune_run(text, extensions=None):
+	""" Convert markdown text with mistune (--engine mistune). Meta, heading 
+	ids & toc are made as the extensions do (extensions aren't used). 
+	Returns html, toc & meta (dict)
+	"""
+
+	md = getattr(CONVERTERS, 'mistune', None)
+
+	if md is None:
+		if hasattr(mistune, 'create_markdown'): # 2.x
+			md = mistune.create_markdown(escape=False, hard_wrap=True, 
+							plugins=['table', 'footnotes', 'strikethrough'])
+		else:
+			md = mistune.Markdown(escape=False, hard_wrap=True)
+
+		CONVERTERS.mistune = md
+
+	# text_metaCheck() mark for markdown: there's no meta
+	if text.startswith("\n\r "):
+		text = text[3:]
+
+	meta, text = text_metaSplit(text)
+	html, toc  = html_headingIds(md(text))
+
+	return html, toc, meta
+
+
+# conversion engines (--engine): function(text, extensions) returning html, toc & meta (dict)
+ENGINES = collections.OrderedDict([
+		('markdown', md_run),
+		('mistune',  mistune_run)
+	])
+
+
+def engine_run(text, extensions=None):
+	""" Convert markdown text with the engine of CONFIG """
+
+	return ENGINES[CONFIG['engine']](text, extensions)
+
+
+def engine_job(job):
+	""" engine_run() of a (text, extensions) job, for the worker pool """
+
+	return engine_run(*job)
+
+
+def md_convert(text, extensions=None):
+	""" engine_run() here, or in an isolated worker if --file-timeout """
+
+	if CONFIG['file_timeout']:
+		worker = getattr(WORKERS, 'worker', None)
+
+		if worker is None:
+			worker = WORKERS.worker = ConvertWorker()
+
+		result = worker.convert(text, CONFIG['file_timeout'], extensions)
+	else:
+		result = engine_run(text, extensions)
+
+	stats_add('conversions')
+
+	return result
+
+
+def isolated_main(connection):
+	""" Worker process (ConvertWorker): convert the texts received until the pipe closes """
+
+	while True:
+		try:
+			text, extensions = connection.recv()
+		except EOFError:
+			break
+
+		try:
+			connection.send((engine_run(text, extensions), None))
+		except Exception as exc:
+			connection.send((None, type(exc).__name__ + ': ' + str(exc)))
+
+
+def stats_add(key, value=1):
+	""" Add to a counter of STATS """
+
+	with STATS_LOCK:
+		STATS[key] = STATS.get(key, 0) + value
+
+
+def mem_current():
+	""" Memory in use (bytes): RSS of the process """
+
+	try:
+		with open('/proc/self/statm', 'rb') as statm:
+			return int(statm.read().split()[1]) * resource.getpagesize()
+	except (IOError, OSError):
+		pass
+
+	# no /proc: peak so far is the best there is
+	return mem_high()
+
+
+def mem_high():
+	""" Peak RSS of the process so far (bytes), 0 if unknown """
+
+	if resource is None:
+		return 0
+
+	peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+	# bytes in mac, kilobytes in linux
+	return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def mem_mb(size):
+	""" bytes to MB """
+
+	return size / (1024.0 * 1024)
+
+
+@contextlib.contextmanager
+def mem_measure(kind, name):
+	""" Measure the peak memory of the block, if --mem-report/--mem-budget """
+
+	if MEMORY is None:
+		yield
+	else:
+		with MEMORY.measure(kind, name):
+			yield
+
+
+def text_metaCheck(text):
+	""" Check if there's real meta or just title with :; if not real (the 
+	second line underlines a title), add line breaks so it doesn't parse as meta
+	"""
+
+	lines = text.split("\n", 2)
+
+	if len(lines) > 1 and (lines[1].startswith('==') or lines[1].startswith('--')):
+		return "\n\r " + text
+
+	return text
+
+
+def text_metaSplit(text):
+	""" Meta-data at the start of the text, as the meta extension reads it.
+	Returns meta (dict of lists, lowercase keys) & the rest of the text
+	"""
+
+	meta  = dict()
+	lines = text.split("\n")
+	key   = None
+
+	for i, line in enumerate(lines):
+		data = META_LINE.match(line)
+		more = META_MORE.match(line)
+
+		if data:
+			key = data.group(1).lower()
+			meta.setdefault(key, []).append(data.group(2).strip())
+		elif more and key:
+			meta[key].append(more.group(1).strip())
+		else:
+			# a blank line ends it, anything else means there's no meta
+			if line.strip() and i == 0:
+				return meta, text
+
+			return meta, "\n".join(lines[i + 1 if not line.strip() else i:])
+
+	return meta, ""
+
+
+def path_find(file_path):
+	""" Find path of file """
+
+	return os.path.abspath(file_path)
+
+
+def path_relative_to(this_path, root=None, index=False):
+	"""Gets the relative path of this file from another path
+	root default is ouput folder 
+	"""
+
+	if root is None:
+		root = CONFIG['output']
+	
+	if index:
+		return os.path.relpath(this_path, root)
+		
+	# Delete first "folder" (..\)
+	return os.path.relpath(this_path, root)[3:]
+
+
+def path_output(filepath):
+	""" Creates the output path """
+	
+	path_out = CONFIG['output']
+
+	if not path_out:
+		newPath = path_delExtension(filepath)
+	else:
+		if CONFIG['flat'] or (not CONFIG['flat'] and filepath == CONFIG['source']):
+			newPath = os.path.join(path_out, path_delExtension(path_getFilename(filepath)))
+		else:
+			# remove first \
+			newPath = os.path.join(path_out, path_delExtension(filepath)[len(CONFIG['source']) + 1:])
+
+	return newPath + ".html"
+	
+
+def path_outputDir():
+	""" Folder for project-wide outputs (merged file, index...) """
+
+	return CONFIG['output'] if CONFIG['output'] else os.getcwd()
+
+
+def path_buildFile(filename):
+	""" File of the build itself (DEPS_FILENAME...) next to the output folder,
+	not in it, so it isn't published: .NAME + filename. With --atomic, next 
+	to the live output
+	"""
+
+	output       = ATOMIC[0] if ATOMIC is not None else CONFIG['output']
+	parent, name = os.path.split(os.path.abspath(output))
+
+	return os.path.join(parent, "." + name + filename)
+
+
+def path_public(path):
+	""" Path as it's seen once published: in the live output folder, not in 
+	the staging one (--atomic)
+	"""
+
+	if ATOMIC is not None and path.startswith(ATOMIC[1]):
+		return ATOMIC[0] + path[len(ATOMIC[1]):]
+
+	return path
+
+
+def path_delExtension(file_path):
+	""" Delete the extension from path """
+
+	path, _ = os.path.splitext(file_path)
+	return path
+
+
+def path_mkdir(path):
+	""" make tree dirs from path """
+
+	if not path:
+		return # current folder
+
+	try:
+		os.makedirs(path)
+	except OSError as exc:
+		if exc.errno != errno.EEXIST:
+			raise 
+
+
+def file_writeIfChanged(path, data):
+	""" Write data (bytes) unless the file already has it, so unchanged outputs
+	keep their mtime. Returns 'A' (added), 'M' (modified) or None (unchanged) 
+	"""
+
+	if os.path.exists(path):
+		if os.path.getsize(path) == len(data):
+			with open(path, 'rb') as oldFile:
+				if oldFile.read() == data:
+					return None
+
+		status = 'M'
+	else:
+		# create output tree folders if doesnt exist
+		path_mkdir(path_get(path))
+		status = 'A'
+
+	file_replace(path, data)
+
+	return status
+
+
+def file_replace(path, data):
+	""" Write data (bytes) in a new file that takes the place of path, so it's
+	never seen half written and the hardlinks of the old one (--atomic) keep it
+	"""
+
+	temp = path + ".pymd-tmp"
+
+	with open(temp, 'wb') as tempFile:
+		tempFile.write(data)
+
+	try:
+		os.rename(temp, path)
+	except OSError:
+		os.remove(path) # windows doesn't replace
+		os.rename(temp, path)
+
+
+def file_read(path):
+	""" Text of a source (utf-8, with or without BOM). Big files are mapped
+	and decoded from the map, not read into a buffer first 
+	"""
+
+	with open(path, 'rb') as inputFile:
+		if os.path.getsize(path) < MMAP_SIZE:
+			return inputFile.read().decode('utf-8-sig')
+
+		mapped = mmap.mmap(inputFile.fileno(), 0, access=mmap.ACCESS_READ)
+
+		try:
+			return codecs.decode(mapped, 'utf-8-sig')
+		finally:
+			mapped.close()
+
+
+def file_hash(path):
+	""" sha1 of the file content, read in chunks """
+
+	digest = hashlib.sha1()
+
+	with open(path, 'rb') as inputFile:
+		for chunk in iter(lambda: inputFile.read(1 << 20), b""):
+			digest.update(chunk)
+
+	return digest.hexdigest()
+
+
+def file_link(source, dest):
+	""" Make dest the same as source without copying if possible: hardlink, 
+	else reflink (copy on write), else copy 
+	"""
+
+	path_mkdir(path_get(dest))
+
+	if os.path.lexists(dest):
+		os.remove(dest)
+
+	try:
+		os.link(source, dest)
+		return
+	except (OSError, AttributeError):
+		pass # other device, not supported...
+
+	if fcntl is not None:
+		try:
+			with open(source, 'rb') as sourceFile, open(dest, 'wb') as destFile:
+				fcntl.ioctl(destFile.fileno(), FICLONE, sourceFile.fileno())
+			return
+		except (IOError, OSError):
+			os.remove(dest)
+
+	shutil.copy2(source, dest)
+
+
+def asset_split(url):
+	""" Split url in path and suffix (?query, #fragment) """
+
+	for mark in ('?', '#'):
+		if mark in url:
+			url, suffix = url.split(mark, 1)
+			return url, mark + suffix
+
+	return url, ""
+
+
+def url_quote(path):
+	""" Path as an url: percent-encoded utf-8 """
+
+	if not isinstance(path, bytes):
+		path = path.encode('utf-8')
+
+	return quote(path)
+
+
+def url_unquote(url):
+	""" Path of an url, its percent-encoded bytes as utf-8 """
+
+	if str is bytes: # python 2 unquotes bytes
+		return unquote(url.encode('utf-8')).decode('utf-8')
+
+	return unquote(url)
+
+
+def asset_source(url, page_dir):
+	""" The local file an url (in a page from page_dir) links to, if it's an 
+	asset (not a page or external). Else None 
+	"""
+
+	if not url or url.startswith(('#', '/')) or re.match(r'[a-zA-Z][\w+.-]*:', url):
+		return None
+
+	url_path, _ = asset_split(url)
+	source      = os.path.abspath(os.path.join(page_dir, url_unquote(url_path)))
+
+	if source.endswith(EXTENSIONS_ACCEPTED + ('.html',)) or not os.path.isfile(source):
+		return None
+
+	return source
+
+
+def path_get(thefile):
+	""" Get path from file """
+
+	return os.path.dirname(thefile)
+
+
+def path_getFilename(file_path):
+	""" Get filename from path"""
+
+	return os.path.basename(file_path)
+
+
+def path_lastDir(path):
+	""" Get last dir from path """
+
+	return os.path.split(path)[1]
+
+
+def files_get (elements):
+	""" Get a list of files in dir. Returns list """ 
+
+	theFiles = list()
+
+	if os.path.isfile(elements):
+		if os.path.exists(elements) and elements.endswith(EXTENSIONS_ACCEPTED):
+			theFiles.append(elements)
+	else:
+		for root, subFolders, files in os.walk(elements):
+			for filename in files:
+				filePath = os.path.join(root, filename)
+
+				if os.path.exists(filePath) and filePath.endswith(EXTENSIONS_ACCEPTED):
+					theFiles.append(filePath)
+
+	return theFiles	
+
+
+def files_list(path):
+	"""Gets the files from the .list (returns list). If not a .list, calls files_get()"""
+	global CONFIG
+
+	if path.endswith(".list"):
+		CONFIG['flat'] = True
+		fileList = list()
+		cmd      = cmd_open_write(path, 'r')
+			
+		with cmd as listFiles:
+			for line in listFiles:
+				line = line.strip()
+
+				# extensions profile of the list
+				if line.startswith("extensions:"):
+					CONFIG['list_extensions'] += line[len("extensions:"):].replace(',', ' ').split()
+
+				elif line.endswith(EXTENSIONS_ACCEPTED) and os.path.exists(line):
+					fileList.append(line)
+		return fileList
+	
+	return files_get(path)
+
+
+def html_cssDefault():
+	""" Default css in a big string """
+
+	returnMe = """
+	* 			{ margin: 0; padding: 0; }
+	html, body 	{ color: black; }
+	
+	body {
+		padding: 10px 25px; max-width: 700px; margin: 5px auto; 
+	"""
+
+	if CONFIG['serif']:
+		returnMe += "	font: 14px 'Droid Serif', Georgia, serif;"
+	else:
+		returnMe += "	font: 14px helvetica, arial, freesans, sans-serif;"
+
+	returnMe += """
+	    line-height: 1.6em;
+		color: #3A3A3A;
+		background-color: #f2f2f2;
+	}
+
+	p { margin: 1em 0; }
+
+	a 				  {text-decoration: none; border-bottom: 1px dotted; color: #4183c4; }
+	a:hover, a:active { color: #75A837; }
+
+	blockquote {
+		margin: 	14px 0; padding: 	0.7em 11px;
+		color: 		#555;
+		font-style: italic;
+		border-left: 10px solid #838383;
+	}
+
+	img {
+		display: 		  block;
+		background-color: #F3F3F2;
+		border: 		  1px solid #D9D9D7;
 		margin: 		  0px auto;   padding: 		  5px;
 	}
 
-	ins { color:#008000; }
-	del { color:#ACACAC; }
+	ins { color:#008000; }
+	del { color:#ACACAC; }
+
+	hr { border: 0; height: 1px; background: #333; }
+
+	sup, sub, a.footnote-ref {
+	    height: 		0;
+	    line-height: 	1;
+	    vertical-align: super;
+	    position: 		relative;
+	}
+
+	sub 			{vertical-align: sub; top: -1px; }
+	a.footnote-ref { font-size: 1em; }
+
+	abbr { border-bottom: 1px dotted }
+
+	h1,h2,h3,h4,h5,h6 { margin: 15px 0; padding: 4px 0; border-bottom: 1px solid #e0e0e0; }
+	h1 { font-size: 2em;}
+	h2 { font-size: 1.571em; }
+	h3 { font-size: 1.429em; }
+	h4 { font-size: 1.286em; }
+	h5 { font-size: 1.143em; color: #4d4d4d;}
+	h6 { font-size: 1em; color: #666; }
+	h1.title { margin:0 }
+
+	ul, ol 	{ margin: 21px 0 0px 30px; list-style-position: outside; }
+	li 		{ margin: 7px 0 }
+	ul 		{ list-style-type: disc; }
+	ol 		{ list-style-type: decimal-leading-zero; }
+
+	dl, dt, dd { margin: 0; }
+	dl { padding: 0px 1em 10px; }
+	dt { padding: 5px 0 5px; font-weight: bold; line-height: normal; }
+	dd { padding: 0 10px 20px 3em; font-style: italic; }
+	
+	table {
+	    padding: 		0;
+	    margin: 		0 auto 2em auto;
+	    border-spacing: 0;
+	    border-collapse: collapse;
+	    width: 			70%;
+	    border: 		1px solid;
+	}
+	tbody 		  { display: table-row-group; }
+	tfoot 		  { display: table-footer-group; }
+	th, td 		  { padding: 10px 10px 9px; line-height: 18px; border: 1px solid; }
+	table, th, td { border-color:#607692; }
+	th {
+	    padding-top: 	  9px;
+	    font-size: 		  18px;
+	    font-weight:  	  bold !important;
+	    vertical-align:   middle;
+		color: 			  #fff;
+		background-color: #007399; 
+	}
+	tr 		{ vertical-align: top;}
+	tr.odd  { background-color: #CCDAFF; }
+	table p { margin:0; }
+
+	pre, code {
+	    border: 		1px solid #ccc;
+	    font-size: 		12px;
+		font-family: 	Consolas, "Liberation Mono", Courier, monospace;
+		background-color:#eee;
+	}
+
+	pre  { margin: 5px 0 0; padding: 6px 5px; white-space: pre; overflow: auto; }
+	code { margin: 0 2px; padding: 2px 5px; white-space: nowrap; }
+
+	.codehilite, .highlight { margin: 0 20px; overflow: auto; padding: 0 10px; }
+
+	/* 			Code highlight: Perldoc  ------------------ */
+	.hll { background-color: #ffffcc }
+	.c { color: #228B22 } /* Comment */
+	.err { color: #a61717; background-color: #e3d2d2 } /* Error */
+	.k { color: #8B008B; font-weight: bold } /* Keyword */
+	.cm { color: #228B22 } /* Comment.Multiline */
+	.cp { color: #1e889b } /* Comment.Preproc */
+	.c1 { color: #228B22 } /* Comment.Single */
+	.cs { color: #8B008B; font-weight: bold } /* Comment.Special */
+	.gd { color: #aa0000 } /* Generic.Deleted */
+	.ge { font-style: italic } /* Generic.Emph */
+	.gr { color: #aa0000 } /* Generic.Error */
+	.gh { color: #000080; font-weight: bold } /* Generic.Heading */
+	.gi { color: #00aa00 } /* Generic.Inserted */
+	.go { color: #888888 } /* Generic.Output */
+	.gp { color: #555555 } /* Generic.Prompt */
+	.gs { font-weight: bold } /* Generic.Strong */
+	.gu { color: #800080; font-weight: bold } /* Generic.Subheading */
+	.gt { color: #aa0000 } /* Generic.Traceback */
+	.kc { color: #8B008B; font-weight: bold } /* Keyword.Constant */
+	.kd { color: #8B008B; font-weight: bold } /* Keyword.Declaration */
+	.kn { color: #8B008B; font-weight: bold } /* Keyword.Namespace */
+	.kp { color: #8B008B; font-weight: bold } /* Keyword.Pseudo */
+	.kr { color: #8B008B; font-weight: bold } /* Keyword.Reserved */
+	.kt { color: #a7a7a7; font-weight: bold } /* Keyword.Type */
+	.m { color: #B452CD } /* Literal.Number */
+	.s { color: #CD5555 } /* Literal.String */
+	.na { color: #658b00 } /* Name.Attribute */
+	.nb { color: #658b00 } /* Name.Builtin */
+	.nc { color: #008b45; font-weight: bold } /* Name.Class */
+	.no { color: #00688B } /* Name.Constant */
+	.nd { color: #707a7c } /* Name.Decorator */
+	.ne { color: #008b45; font-weight: bold } /* Name.Exception */
+	.nf { color: #008b45 } /* Name.Function */
+	.nn { color: #008b45; text-decoration: underline } /* Name.Namespace */
+	.nt { color: #8B008B; font-weight: bold } /* Name.Tag */
+	.nv { color: #00688B } /* Name.Variable */
+	.ow { color: #8B008B } /* Operator.Word */
+	.w  { color: #bbbbbb } /* Text.Whitespace */
+	.mf { color: #B452CD } /* Literal.Number.Float */
+	.mh { color: #B452CD } /* Literal.Number.Hex */
+	.mi { color: #B452CD } /* Literal.Number.Integer */
+	.mo { color: #B452CD } /* Literal.Number.Oct */
+	.sb { color: #CD5555 } /* Literal.String.Backtick */
+	.sc { color: #CD5555 } /* Literal.String.Char */
+	.sd { color: #CD5555 } /* Literal.String.Doc */
+	.s2 { color: #CD5555 } /* Literal.String.Double */
+	.se { color: #CD5555 } /* Literal.String.Escape */
+	.sh { color: #1c7e71; font-style: italic } /* Literal.String.Heredoc */
+	.si { color: #CD5555 } /* Literal.String.Interpol */
+	.sx { color: #cb6c20 } /* Literal.String.Other */
+	.sr { color: #1c7e71 } /* Literal.String.Regex */
+	.s1 { color: #CD5555 } /* Literal.String.Single */
+	.ss { color: #CD5555 } /* Literal.String.Symbol */
+	.bp { color: #658b00 } /* Name.Builtin.Pseudo */
+	.vc { color: #00688B } /* Name.Variable.Class */
+	.vg { color: #00688B } /* Name.Variable.Global */
+	.vi { color: #00688B } /* Name.Variable.Instance */
+	.il { color: #B452CD } /* Literal.Number.Integer.Long */
+
+	.toc 	{ margin-top: 30px; }
+	.toc a  { margin: 0 15px !important; }
+	.toc ul {
+	    margin: 1px 0 0 15px !important;    
+	    padding: 0 0 0 1px !important;
+	    display: block;
+		line-height: 20px;
+		list-style: none;
+	}
+	.toc ul li  { border-left: 1px solid; position: relative; margin:0 !important; }
+	.toc ul > .toc li { padding-bottom: 10px !important;}
+	.toc ul li:before {
+	    content: '';
+	    width: 14px;
+	    position: absolute;
+	    border-bottom: 1px solid;
+	    left: 0px;
+	    top: 10px;
+	}
+	.toc ul li:last-child {border-left:none;}
+	.toc ul li:last-child:before {border-left:1px solid; height: 10px; margin-top:-10px !important; }
+	#.toc ul li, .toc ul li:before, .toc ul li:last-child:before {border-color: #28484D ; }
+	.toc ul li, .toc ul li:before, .toc ul li:last-child:before {border-color: #7A7A7A; }
+	.admonition p   { margin: 0.5em 1em 0.5em 1em; padding: 0;}
+	.admonition pre { margin: 0.4em 1em 0.4em 1em;}
+	.admonition ul, .admonition ol { margin: 0.1em 0.5em 0.5em 3em;   padding: 0;}
+
+	.admonition {
+		margin: 		  2em;
+		padding: 		  0;
+		font-size: 		  0.9em;
+	    border: 		  1px solid #c2c2c2;
+	    background-color: #e9e9e9;
+	}
+
+	.admonition p.admonition-title {
+		margin: 	0;
+		padding: 	0.1em 0 0.1em 0.5em;
+		font-size: 	1.1em;
+		font-weight: bold;
+		color: 		#fff;
+	    border-bottom: 1px solid #c2c2c2;
+		background-color: #999; 
+	}
+
+	.admonition.error, .admonition.caution, .admonition.danger
+	{border-color: #900000; background-color: #ffe9e9;}
+
+	.error p.admonition-title, .caution p.admonition-title, .danger p.admonition-title
+	{background-color: #b04040; border-color: #900000;}
+
+	.admonition.hint, .admonition.download 
+	{background-color: #ECFAE3;  border-color: #609060;}
+
+	.hint p.admonition-title, .download p.admonition-title 
+	{background-color: #70A070; border-color: #609060;}
+
+	.admonition.note, .admonition.tip, .admonition.warning
+	{border-color:#e2ba54; background-color:#fcfce1;}
+
+	.note p.admonition-title, .tip p.admonition-title, .warning p.admonition-title
+	{background-color: #f1d170; border-color:#e2ba54;}
+
+	.admonition.info, .admonition.attention, .admonition.important
+	{background-color: #e8edfc; border-color: #94A7BF;}
+
+	.info p.admonition-title, .attention p.admonition-title, .important p.admonition-title
+	{background-color: #7088A0; border-color: #94A7BF;}
+
+	.nav   { text-align: center; font-size: 1.2em; }
+	.nav a { margin-left: 2em; display: inline-block; }
+	.nav:first-of-type{ margin-bottom: 2em; }
+	.nav:last-of-type { margin-top: 2em; }
+	"""
+	
+	return returnMe
+
+
+def html_template():
+	""" The page template of this build, compiled once. Compiled again if the
+	template file changes (daemon workers live across builds)
+	"""
+
+	# by absolute path, daemon requests come from any folder
+	key = (CONFIG['template'] and os.path.abspath(CONFIG['template']), CONFIG['css'], CONFIG['serif'])
+
+	if CONFIG['template'] and os.path.exists(CONFIG['template']):
+		info = os.stat(CONFIG['template'])
+		key += (info.st_mtime, info.st_size)
+
+	if key not in TEMPLATES:
+		# the older versions of the file
+		for old in [old for old in TEMPLATES if old[:3] == key[:3]]:
+			del TEMPLATES[old]
+
+		if not CONFIG['css']:
+			css = "<style>" + html_cssDefault() + "</style>"
+		else: 
+			css = '<link rel="stylesheet" href="' + CONFIG['css'] + '" type="text/css">'
+
+		if CONFIG['template']:
+			with cmd_open_write(CONFIG['template'], 'r') as templateFile:
+				text = templateFile.read()
+		else:
+			text = PAGE_TEMPLATE
+
+		TEMPLATES[key] = PageTemplate(text, {'css': css})
+
+	return TEMPLATES[key]
+
+
+def html_complete(title, meta, text):
+	""" reformat the text to valid HTML page """
+
+	return html_template().render({'title': title, 'meta': meta, 'body': text})
+
+
+def html_bookNavigation(current_path, prev_path, prev_title, next_path, next_title):
+	""" Makes the navigation links """
+
+	navPre  = ""
+	navNext = ""
+
+	if prev_path:
+		prev_path = path_relative_to(prev_path, current_path)
+		prev_text = '&lt; ' + prev_title if CONFIG['nav'] else '&lt; prev'
+		navPre    = ''.join(('<a href="', prev_path, '">', prev_text, '</a>'))
+
+	if next_path:
+		next_path = path_relative_to(next_path, current_path)
+		next_text = next_title + ' &gt;' if CONFIG['nav'] else 'next &gt;'
+		navNext   = ''.join(('<a href="', next_path, '">', next_text, '</a>'))
+
+	index_url = path_relative_to(os.path.join(path_outputDir(), 'index.html'), current_path)
+
+	return ''.join(('<div class="nav">', navPre, ' <a href="', index_url, '">index</a> ', 
+					navNext, '</div>'))
+
+
+def html_headingIds(html):
+	""" Give ids to the headings of a document and make its toc, as the toc 
+	extension does (engines other than markdown). Returns html & toc
+	"""
+
+	ids      = set()
+	headings = list()
+
+	def replace(match):
+		level, inner = match.groups()
+		text   = re.sub(r'<[^>]+>', '', inner).strip()
+		anchor = markdown.extensions.toc.unique(markdown.extensions.toc.slugify(text, '-'), ids)
+
+		headings.append((int(level), anchor, text))
+
+		return '<h' + level + ' id="' + anchor + '">' + inner + '</h' + level + '>'
+
+	html = HEADING.sub(replace, html)
+
+	return html, html_toc(headings)
+
+
+def html_toc(headings):
+	""" toc (as the toc extension) of headings: (level, id, text) """
+
+	toc   = '<div class="toc">\n<ul>'
+	stack = list() # levels of the open lists
+
+	if headings:
+		toc += '\n'
+
+	for level, anchor, text in headings:
+		if not stack:
+			stack.append(level)
+		elif level > stack[-1]:
+			toc += '<ul>\n'
+			stack.append(level)
+		else:
+			toc += '</li>\n'
+
+			while len(stack) > 1 and level < stack[-1]:
+				stack.pop()
+				toc += '</ul>\n</li>\n'
+
+		toc += '<li><a href="#' + anchor + '">' + text + '</a>'
+
+	if stack:
+		toc += '</li>\n'
+
+		while len(stack) > 1:
+			stack.pop()
+			toc += '</ul>\n</li>\n'
+
+	return toc + '</ul>\n</div>\n'
+
+
+def html_uniqueIds(html, toc, used):
+	""" Rename the ids of a merged chapter (and the links to them in its html 
+	and toc) that the previous ones already have, as markdown does: id_1, id_2...
+	used has the ids of the merged file so far, it's updated. Returns html, toc
+	& the renamed ids {old: new}
+	"""
+
+	own     = set(anchor for kind, anchor, _ in ANCHOR.findall(html) if kind != 'href="#')
+	renamed = dict()
+
+	for anchor in sorted(own & used):
+		n = 1
+
+		while anchor + "_" + str(n) in used or anchor + "_" + str(n) in own:
+			n += 1
+
+		renamed[anchor] = anchor + "_" + str(n)
+		used.add(renamed[anchor])
+
+	used.update(own)
+
+	if not renamed:
+		return html, toc, renamed
+
+	def replace(match):
+		return match.group(1) + renamed.get(match.group(2), match.group(2)) + match.group(3)
+
+	return ANCHOR.sub(replace, html), ANCHOR.sub(replace, toc), renamed
+
+
+def html_articleId(path, used):
+	""" Id for the article of a merged chapter (source path), from its output
+	name: sub/deep.md is sub-deep. Not in used, that's updated 
+	"""
+
+	name = os.path.relpath(path_output(path), path_outputDir())
+	base = re.sub(r'[^\w-]+', '-', path_delExtension(name)).strip('-') or "chapter"
+	
+	anchor = base
+	n      = 1
+
+	while anchor in used:
+		anchor = base + "_" + str(n)
+		n += 1
+
+	used.add(anchor)
+
+	return anchor
+
+
+def html_finalText(file_data, header_data, navigation=""):
+	""" Gathers data and returns the final HTML """
+
+	title = ""
+	meta  = ""
+	body  = ""
+
+	if header_data.html or header_data.title:
+		title = header_data.title + " | " + file_data.title
+		meta  = ''.join((navigation, header_data.html, "\n\r<article>", file_data.meta))
+		body  = ''.join((file_data.html, "</article>\n\r", navigation))
+	else:
+		title = file_data.title
+		meta  = ''.join(("\n\r<header>", navigation, file_data.meta, "</header>\n\r"))
+		body  = ''.join(("\n\r<article>", file_data.html, "</article>\n\r", navigation))
+
+	return html_complete(title, meta, body)
+
+
+# ---------------------
+# Methods: Parsing
+# ---------------------
+
+def pagesSpecial(filelist, path_header="", path_index=""):
+	""" Finds header & index files, and deletes them from file list
+	Returns the modified file list, new header path, new index path
+	"""
+
+	# existance of header or index in files
+	headerList = index_containing_substring(filelist, HEADER_FILENAME + ".")
+	indexList  = index_containing_substring(filelist, INDEX_FILENAME + ".")
+
+	if path_header or headerList:
+		if headerList and not path_header:
+			path_header = filelist[headerList -1]
+
+		path_header = path_find(path_header)
+		filelist    = [path for path in filelist if path_find(path) != path_header]
+
+	if path_index or indexList:
+		if indexList and not path_index:
+			path_index = filelist[indexList -1]
+
+		path_index = path_find(path_index)
+		filelist   = [path for path in filelist if path_find(path) != path_index]
+
+	return filelist, path_header, path_index
+
+def headerCreation(header_file=""):
+	"""Checks and creates/prepare the header"""
+
+	if header_file and os.path.exists(header_file):
+		header = Parsing(header_file)
+
+		if header.meta:
+			header.meta = "\n\r<header>" + header.meta + "</header>\n\r"
+
+		if header.meta or header.html: 
+			header.html = '\n\r<section id="head">' + header.meta + \
+							header.html + "</section>\n\r"
+	else:
+		header = Parsing("")
+
+	return header 
+
+
+def findH1(text):
+	""" Finds the title (h1) in the HTML and returns it. If not: return None """
+
+	if text.find("<h1 ") >- 1: # because of extensions
+		title = text[text.find("<h1 ") + 4:text.find("</h1>")]
+		title = title.split(">")[1] # dirty fix
+
+		return title
+
+	return None
+
+
+def tocMerge(tocs):
+	"""Merge multiple TOCs (HTML) into one. Does filtering """
+
+	tocDepth = CONFIG['toc']
+	tocFinal = tocs.replace('\n</ul>\n</div>', "")
+
+	if tocDepth == 0:
+		tocFinal = tocFinal.replace('<div class="toc">\n<ul>\n', "") # dont touch
+		
+		# remove blank lines
+		tocFinal = os.linesep.join([s for s in tocFinal.splitlines() if s])
+
+	else:
+		allTocs     = tocFinal.split('<div class="toc">\n<ul>')[1:] # remove first as it's blank
+		tocBuilding = ""
 
-	hr { border: 0; height: 1px; background: #333; }
+		for toc in allTocs:
+			toc = toc.replace('<ul>', '\n<ul>')
+			tocSplitted = toc.split("\n")[1:]
 
-	sup, sub, a.footnote-ref {
-	    height: 		0;
-	    line-height: 	1;
-	    vertical-align: super;
-	    position: 		relative;
-	}
+			if tocDepth == 1:
+				tocBuilding += tocSplitted[0] + "</li>"
+			else:
+				ulCount = 1
+				doPrint = True
 
-	sub 			{vertical-align: sub; top: -1px; }
-	a.footnote-ref { font-size: 1em; }
+				for item in tocSplitted:
+					if item == "<ul>":
+						ulCount = ulCount + 1
+					if item == "</ul>":
+						ulCount = ulCount - 1
 
-	abbr { border-bottom: 1px dotted }
+					if ulCount <= tocDepth:
+						doPrint = True
+					else:
+						if item == "<ul>": # dirty fix
+							tocBuilding += item 
+						doPrint = False
 
-	h1,h2,h3,h4,h5,h6 { margin: 15px 0; padding: 4px 0; border-bottom: 1px solid #e0e0e0; }
-	h1 { font-size: 2em;}
-	h2 { font-size: 1.571em; }
-	h3 { font-size: 1.429em; }
-	h4 { font-size: 1.286em; }
-	h5 { font-size: 1.143em; color: #4d4d4d;}
-	h6 { font-size: 1em; color: #666; }
-	h1.title { margin:0 }
+					if doPrint:
+						tocBuilding += item
 
-	ul, ol 	{ margin: 21px 0 0px 30px; list-style-position: outside; }
-	li 		{ margin: 7px 0 }
-	ul 		{ list-style-type: disc; }
-	ol 		{ list-style-type: decimal-leading-zero; }
 
-	dl, dt, dd { margin: 0; }
-	dl { padding: 0px 1em 10px; }
-	dt { padding: 5px 0 5px; font-weight: bold; line-height: normal; }
-	dd { padding: 0 10px 20px 3em; font-style: italic; }
+		tocFinal = tocBuilding
+
+	return '<div class="toc"><ul>' + tocFinal + '</ul></div>' 
+
+
+def linksRender(page, outputPath):
+	""" Make the wiki links of the page (Parsing) for its output """
+
+	if LINKS is not None:
+		page.html = LINKS.render(page.html, outputPath)
+
+
+def assetsRewrite(page, outputPath):
+	""" Mirror the assets of the page (Parsing) and fix its links, if --assets """
+
+	if ASSETS is not None:
+		ASSETS.rewrite(page, outputPath)
+
+
+def assetsCarry(outputPath):
+	""" Keep the assets of an output that isn't rebuilt, if --assets """
+
+	if ASSETS is not None:
+		ASSETS.carry(outputPath)
+
+
+def pageTimedOut(page, outputPath, graph):
+	""" Handle a page (Parsing) whose conversion was killed. Returns True if 
+	it must be skipped, else it's saved with its placeholder 
+	"""
+
+	if not page.timedOut:
+		return False
+
+	if CONFIG['on_timeout'] == 'skip':
+		graph.drop(outputPath)
+		return True
+
+	graph.setTimedOut(outputPath)
+	return False
+
+
+def makeFiles(theHeader, graph, cache, doMerge=False):
+	""" Process files in folder, alone, or .list. No book option """
+
+	doAll      = not CONFIG['incremental']
+	headerDeps = [theHeader.sourcePath] + profile_deps([theHeader.sourcePath]) if theHeader.sourcePath else []
+	list_files = CONFIG['fileslist']
+
+	if not doMerge:
+		for this_file in list_files:
+			outputPath = path_output(this_file)
+			content    = [this_file] + profile_deps([this_file]) + headerDeps
+
+			graph.add(outputPath, content)
+
+			if doAll or graph.isDirty(outputPath, content):
+				file_current = cache.get(this_file)
+				graph.setLinks(outputPath, file_current.links)
+
+				if not pageTimedOut(file_current, outputPath, graph):
+					linksRender(file_current, outputPath)
+					assetsRewrite(file_current, outputPath)
+					file_current.html       = html_finalText(file_current, theHeader)
+					file_current.outputPath = outputPath
+					file_current.save()
+			else:
+				assetsCarry(outputPath)
+
+			cache.release(this_file)
+
+		return
+
+	outputName = path_lastDir(path_get(path_output(list_files[-1]))) + ".html"
+	outputPath = os.path.join(path_outputDir(), outputName)
+	content    = list_files + profile_deps(list_files) + headerDeps
+
+	graph.add(outputPath, content)
+
+	if not doAll and not graph.isDirty(outputPath, content):
+		assetsCarry(outputPath)
+
+		for this_file in list_files:
+			cache.release(this_file)
+
+		return
+
+	projectTocs  = ""
+	articles     = list() # (path, html)
+	renamed      = dict() # path: ids renamed in the chapter
+	linked       = list()
+
+	# chapters can't repeat the ids of the header or the previous ones
+	usedIds = set(anchor for kind, anchor, _ in ANCHOR.findall(theHeader.html) if kind != 'href="#')
+
+	cache.convertAll(list_files)
 	
-	table {
-	    padding: 		0;
-	    margin: 		0 auto 2em auto;
-	    border-spacing: 0;
-	    border-collapse: collapse;
-	    width: 			70%;
-	    border: 		1px solid;
-	}
-	tbody 		  { display: table-row-group; }
-	tfoot 		  { display: table-footer-group; }
-	th, td 		  { padding: 10px 10px 9px; line-height: 18px; border: 1px solid; }
-	table, th, td { border-color:#607692; }
-	th {
-	    padding-top: 	  9px;
-	    font-size: 		  18px;
-	    font-weight:  	  bold !important;
-	    vertical-align:   middle;
-		color: 			  #fff;
-		background-color: #007399; 
-	}
-	tr 		{ vertical-align: top;}
-	tr.odd  { background-color: #CCDAFF; }
-	table p { margin:0; }
+	with mem_measure('stage', 'merge: projectWhole'):
+		for this_file in list_files:
+			file_current = cache.get(this_file)
+			cache.release(this_file)
 
-	pre, code {
-	    border: 		1px solid #ccc;
-	    font-size: 		12px;
-		font-family: 	Consolas, "Liberation Mono", Courier, monospace;
-		background-color:#eee;
-	}
+			linked += file_current.links
 
-	pre  { margin: 5px 0 0; padding: 6px 5px; white-space: pre; overflow: auto; }
-	code { margin: 0 2px; padding: 2px 5px; white-space: nowrap; }
+			if file_current.timedOut:
+				graph.setTimedOut(outputPath)
 
-	.codehilite, .highlight { margin: 0 20px; overflow: auto; padding: 0 10px; }
+				if CONFIG['on_timeout'] == 'skip':
+					continue
 
-	/* 			Code highlight: Perldoc  ------------------ */
-	.hll { background-color: #ffffcc }
-	.c { color: #228B22 } /* Comment */
-	.err { color: #a61717; background-color: #e3d2d2 } /* Error */
-	.k { color: #8B008B; font-weight: bold } /* Keyword */
-	.cm { color: #228B22 } /* Comment.Multiline */
-	.cp { color: #1e889b } /* Comment.Preproc */
-	.c1 { color: #228B22 } /* Comment.Single */
-	.cs { color: #8B008B; font-weight: bold } /* Comment.Special */
-	.gd { color: #aa0000 } /* Generic.Deleted */
-	.ge { font-style: italic } /* Generic.Emph */
-	.gr { color: #aa0000 } /* Generic.Error */
-	.gh { color: #000080; font-weight: bold } /* Generic.Heading */
-	.gi { color: #00aa00 } /* Generic.Inserted */
-	.go { color: #888888 } /* Generic.Output */
-	.gp { color: #555555 } /* Generic.Prompt */
-	.gs { font-weight: bold } /* Generic.Strong */
-	.gu { color: #800080; font-weight: bold } /* Generic.Subheading */
-	.gt { color: #aa0000 } /* Generic.Traceback */
-	.kc { color: #8B008B; font-weight: bold } /* Keyword.Constant */
-	.kd { color: #8B008B; font-weight: bold } /* Keyword.Declaration */
-	.kn { color: #8B008B; font-weight: bold } /* Keyword.Namespace */
-	.kp { color: #8B008B; font-weight: bold } /* Keyword.Pseudo */
-	.kr { color: #8B008B; font-weight: bold } /* Keyword.Reserved */
-	.kt { color: #a7a7a7; font-weight: bold } /* Keyword.Type */
-	.m { color: #B452CD } /* Literal.Number */
-	.s { color: #CD5555 } /* Literal.String */
-	.na { color: #658b00 } /* Name.Attribute */
-	.nb { color: #658b00 } /* Name.Builtin */
-	.nc { color: #008b45; font-weight: bold } /* Name.Class */
-	.no { color: #00688B } /* Name.Constant */
-	.nd { color: #707a7c } /* Name.Decorator */
-	.ne { color: #008b45; font-weight: bold } /* Name.Exception */
-	.nf { color: #008b45 } /* Name.Function */
-	.nn { color: #008b45; text-decoration: underline } /* Name.Namespace */
-	.nt { color: #8B008B; font-weight: bold } /* Name.Tag */
-	.nv { color: #00688B } /* Name.Variable */
-	.ow { color: #8B008B } /* Operator.Word */
-	.w  { color: #bbbbbb } /* Text.Whitespace */
-	.mf { color: #B452CD } /* Literal.Number.Float */
-	.mh { color: #B452CD } /* Literal.Number.Hex */
-	.mi { color: #B452CD } /* Literal.Number.Integer */
-	.mo { color: #B452CD } /* Literal.Number.Oct */
-	.sb { color: #CD5555 } /* Literal.String.Backtick */
-	.sc { color: #CD5555 } /* Literal.String.Char */
-	.sd { color: #CD5555 } /* Literal.String.Doc */
-	.s2 { color: #CD5555 } /* Literal.String.Double */
-	.se { color: #CD5555 } /* Literal.String.Escape */
-	.sh { color: #1c7e71; font-style: italic } /* Literal.String.Heredoc */
-	.si { color: #CD5555 } /* Literal.String.Interpol */
-	.sx { color: #cb6c20 } /* Literal.String.Other */
-	.sr { color: #1c7e71 } /* Literal.String.Regex */
-	.s1 { color: #CD5555 } /* Literal.String.Single */
-	.ss { color: #CD5555 } /* Literal.String.Symbol */
-	.bp { color: #658b00 } /* Name.Builtin.Pseudo */
-	.vc { color: #00688B } /* Name.Variable.Class */
-	.vg { color: #00688B } /* Name.Variable.Global */
-	.vi { color: #00688B } /* Name.Variable.Instance */
-	.il { color: #B452CD } /* Literal.Number.Integer.Long */
+			assetsRewrite(file_current, outputPath)
 
-	.toc 	{ margin-top: 30px; }
-	.toc a  { margin: 0 15px !important; }
-	.toc ul {
-	    margin: 1px 0 0 15px !important;    
-	    padding: 0 0 0 1px !important;
-	    display: block;
-		line-height: 20px;
-		list-style: none;
-	}
-	.toc ul li  { border-left: 1px solid; position: relative; margin:0 !important; }
-	.toc ul > .toc li { padding-bottom: 10px !important;}
-	.toc ul li:before {
-	    content: '';
-	    width: 14px;
-	    position: absolute;
-	    border-bottom: 1px solid;
-	    left: 0px;
-	    top: 10px;
-	}
-	.toc ul li:last-child {border-left:none;}
-	.toc ul li:last-child:before {border-left:1px solid; height: 10px; margin-top:-10px !important; }
-	#.toc ul li, .toc ul li:before, .toc ul li:last-child:before {border-color: #28484D ; }
-	.toc ul li, .toc ul li:before, .toc ul li:last-child:before {border-color: #7A7A7A; }
-	.admonition p   { margin: 0.5em 1em 0.5em 1em; padding: 0;}
-	.admonition pre { margin: 0.4em 1em 0.4em 1em;}
-	.admonition ul, .admonition ol { margin: 0.1em 0.5em 0.5em 3em;   padding: 0;}
+			file_current.html, file_current.toc, renamed[this_file] = html_uniqueIds(
+									file_current.html, file_current.toc, usedIds)
+
+			projectTocs += file_current.toc
+			articles.append((this_file, file_current.meta + file_current.html))
+
+		# wiki links to merged chapters go to their article, that gets an id
+		targets  = set(linked)
+		chapters = dict((path, (html_articleId(path, usedIds), renamed[path])) 
+						for path in list_files if path in renamed and path in targets)
+
+		projectWhole = "".join('\r\n <article' + 
+						(' id="' + chapters[path][0] + '"' if path in chapters else "") + '>' + 
+						html + "</article>\n\r" for path, html in articles)
+
+		if LINKS is not None:
+			projectWhole = LINKS.render(projectWhole, outputPath, chapters)
+
+	graph.setLinks(outputPath, linked)
+
+	with mem_measure('stage', 'merge: tocMerge'):
+		projectTocs = tocMerge(projectTocs)
+	header_text = theHeader.html.replace('[TOC_HERE]', projectTocs)
+
+	merged = Parsing("")
+	merged.html       = html_complete(theHeader.title, header_text, projectWhole)
+	merged.outputPath = outputPath
+
+	merged.save()
+
+
+def makeBook(theHeader, graph, cache, indexFile=""):
+	""" Process files if indicated to be in a book """
+
+	list_files = CONFIG['fileslist']
+	doAll      = not CONFIG['incremental']
+	headerDeps = [theHeader.sourcePath] + profile_deps([theHeader.sourcePath]) if theHeader.sourcePath else []
+
+	# titles first, navigation and index need them. Unchanged files keep 
+	# the title of the last build, so they aren't parsed
+	cache.convertAll([path for path in list_files if doAll or graph.oldTitle(path) is None])
+
+	for path in list_files:
+		title = None if doAll else graph.oldTitle(path)
+
+		if title is None:
+			data_current = cache.get(path)
+			title        = data_current.title
+
+			if data_current.timedOut and CONFIG['on_timeout'] == 'skip':
+				cache.release(path)
+				continue
+
+		graph.setTitle(path, title)
+
+	# skipped files (--file-timeout) aren't chapters
+	list_files = [path for path in list_files if path in graph.titles]
+
+	bookIndex  = "<ul>"
+	filesTotal = len(list_files)
+
+	for i, path in enumerate(list_files):
+		prev_path  = list_files[i - 1] if i > 0 else ""
+		next_path  = list_files[i + 1] if i + 1 < filesTotal else ""
+		neighbours = [near for near in (prev_path, next_path) if near]
+
+		outputPath = path_output(path)
+		content    = [path] + profile_deps([path]) + headerDeps
+
+		current_relative = path_relative_to(outputPath, None, True)
+		bookIndex += '<li><a href="' + current_relative + '">' + \
+						graph.titles[path] + '</a></li>'
+
+		graph.add(outputPath, content, neighbours)
+
+		if not doAll and not graph.isDirty(outputPath, content, neighbours):
+			assetsCarry(outputPath)
+			cache.release(path)
+			continue
+
+		data_current = cache.get(path)
+		cache.release(path)
+
+		graph.setLinks(outputPath, data_current.links)
+
+		if pageTimedOut(data_current, outputPath, graph):
+			continue
+
+		linksRender(data_current, outputPath)
+		assetsRewrite(data_current, outputPath)
+
+		navigation = html_bookNavigation(outputPath, 
+						path_output(prev_path) if prev_path else "", graph.titles.get(prev_path, ""), 
+						path_output(next_path) if next_path else "", graph.titles.get(next_path, ""))
+
+		data_current.html       = html_finalText(data_current, theHeader, navigation)
+		data_current.outputPath = outputPath
+		data_current.save()
+
+	index     = ""
+	indexPath = os.path.join(path_outputDir(), 'index.html')
+
+	# Process the indicated file
+	if indexFile and os.path.exists(indexFile):
+		content = [indexFile] + profile_deps([indexFile])
+
+		graph.add(indexPath, content)
+
+		if doAll or graph.isDirty(indexPath, content):
+			index = Parsing(indexFile, True)
+			index.outputPath = indexPath
+			index.sourcePath = indexFile
+			index.extensions = md_extensions(indexFile)
 
-	.admonition {
-		margin: 		  2em;
-		padding: 		  0;
-		font-size: 		  0.9em;
-	    border: 		  1px solid #c2c2c2;
-	    background-color: #e9e9e9;
-	}
+			parsedIndex, linked = LINKS.mark(index.read(indexFile), indexFile)
+			graph.setLinks(indexPath, linked)
 
-	.admonition p.admonition-title {
-		margin: 	0;
-		padding: 	0.1em 0 0.1em 0.5em;
-		font-size: 	1.1em;
-		font-weight: bold;
-		color: 		#fff;
-	    border-bottom: 1px solid #c2c2c2;
-		background-color: #999; 
-	}
+			index.convert(indexFile, parsedIndex)
 
-	.admonition.error, .admonition.caution, .admonition.danger
-	{border-color: #900000; background-color: #ffe9e9;}
+			if not pageTimedOut(index, indexPath, graph):
+				if index.title == path_public(index.outputPath):
+					index.title = "Index"
 
-	.error p.admonition-title, .caution p.admonition-title, .danger p.admonition-title
-	{background-color: #b04040; border-color: #900000;}
+				linksRender(index, indexPath)
+				assetsRewrite(index, indexPath)
 
-	.admonition.hint, .admonition.download 
-	{background-color: #ECFAE3;  border-color: #609060;}
+				index.html = html_complete("Index", "", index.html)
 
-	.hint p.admonition-title, .download p.admonition-title 
-	{background-color: #70A070; border-color: #609060;}
+				index.save()
 
-	.admonition.note, .admonition.tip, .admonition.warning
-	{border-color:#e2ba54; background-color:#fcfce1;}
+		else:
+			assetsCarry(indexPath)
 
-	.note p.admonition-title, .tip p.admonition-title, .warning p.admonition-title
-	{background-color: #f1d170; border-color:#e2ba54;}
+	# Or create one
+	else:
+		graph.add(indexPath, headerDeps, list_files)
 
-	.admonition.info, .admonition.attention, .admonition.important
-	{background-color: #e8edfc; border-color: #94A7BF;}
+		if doAll or graph.isDirty(indexPath, headerDeps, list_files):
+			index = Parsing("")
 
-	.info p.admonition-title, .attention p.admonition-title, .important p.admonition-title
-	{background-color: #7088A0; border-color: #94A7BF;}
+			index.title      = theHeader.title if theHeader.title else "Index"
+			index.html       = html_complete(index.title, "", bookIndex + "</ul>")
+			index.outputPath = indexPath
 
-	.nav   { text-align: center; font-size: 1.2em; }
-	.nav a { margin-left: 2em; display: inline-block; }
-	.nav:first-of-type{ margin-bottom: 2em; }
-	.nav:last-of-type { margin-top: 2em; }
-	"""
-	
-	return returnMe
+			index.save()
 
+# ---------------------
+# Methods: stdin filter
+# ---------------------
 
-def html_missing (title):
-	"""Complete missing HTML, including CSS. Returns two strings: begining & ending"""
+def std_streams():
+	""" Binary stdin & stdout """
 
-	begining = '<!DOCTYPE html>\n<html>\n<head>\n<meta charset="utf-8">\n<title>' \
-				+ title + '</title>\n'
+	return getattr(sys.stdin, 'buffer', sys.stdin), getattr(sys.stdout, 'buffer', sys.stdout)
 
-	if not CONFIG['css']:
-		begining += "<style>" + html_cssDefault() + "</style>"
 
-	else: 
-		begining += '<link rel="stylesheet" href="' + CONFIG['css'] + ' type="text/css">'
+def filterText(text, theHeader):
+	""" Converts markdown text (not a file) to the final HTML page. Empty if
+	it timed out and --on-timeout is skip 
+	"""
 
-	begining += '\n</head>\n<body>\n'
-	ending   = '</body>\n</html>'
-	
-	return begining, ending
+	file_current = Parsing("")
+	file_current.convert(STDIN_SOURCE, text_metaCheck(text))
 
+	if file_current.timedOut and CONFIG['on_timeout'] == 'skip':
+		return ""
 
-def html_complete(title, meta, text):
-	""" reformat the text to valid HTML page """
+	return html_finalText(file_current, theHeader)
 
-	tagsBeg, tagsEnd = html_missing(title)
-	document = tagsBeg + meta + text + tagsEnd
 
-	return document
+def filterBatch(stream, framing):
+	""" Yields the documents (bytes) in stream, as they arrive. framing is 'nul' 
+	(documents end with NUL) or 'length' (length in bytes, newline, document) 
+	"""
 
+	if framing == 'length':
+		while True:
+			line = stream.readline()
 
-def html_bookNavigation(current_path, prev_path, prev_title, next_path, next_title):
-	""" Makes the navigation links """
+			if not line:
+				return
 
-	navPre  = ""
-	navNext = ""
+			if line.strip():
+				yield stream.read(int(line))
+	else:
+		pending = b""
 
-	if prev_path:
-		prev_path = path_relative_to(prev_path, current_path)
-		
-		if CONFIG['nav']:
-			navPre = '<a href="' + prev_path + '">&lt; '+ prev_title + '</a>'
-		else:
-			navPre = '<a href="' + prev_path + '">&lt; prev</a>'
+		while True:
+			# os.read returns what is available, so a worker gets each 
+			# document as soon as it's sent
+			chunk = os.read(stream.fileno(), 65536)
 
-	if next_path:
-		next_path = path_relative_to(next_path, current_path)
+			if not chunk:
+				break
 
-		if CONFIG['nav']:
-			navNext = '<a href="' + next_path + '">' + next_title + ' &gt;</a>'
-		else: 
-			navNext = '<a href="' + next_path + '">next &gt;</a>'
+			pending += chunk
 
-	index_url = path_relative_to(os.path.join(CONFIG['output'],'index.html'), current_path)
+			while b"\0" in pending:
+				document, pending = pending.split(b"\0", 1)
+				yield document
 
-	return '<div class="nav">' + navPre + ' <a href="'+index_url+'">index</a> '\
-			 + navNext + '</div>'
+		if pending:
+			yield pending
 
 
-def html_finalText(file_data, header_data, navigation=""):
-	""" Gathers data and returns the final HTML """
+def makeFilter(theHeader):
+	""" Process stdin to stdout: one document, or many with --batch """
 
-	title = ""
-	meta  = ""
-	body  = ""
+	stdin, stdout = std_streams()
+	framing = CONFIG['batch']
 
-	if header_data.html or header_data.title:
-		title = header_data.title + " | " + file_data.title
-		meta  = navigation + header_data.html + "\n\r<article>" + file_data.meta
-		body  = file_data.html + "</article>\n\r" + navigation
-	else:
-		title = file_data.title
-		meta  = "\n\r<header>" + navigation + file_data.meta + "</header>\n\r"
-		body  = "\n\r<article>" + file_data.html + "</article>\n\r" + navigation
+	if not framing:
+		text = stdin.read().decode('utf-8-sig')
+		stdout.write(filterText(text, theHeader).encode('utf-8'))
+		stdout.flush()
+		return
 
-	return html_complete(title, meta, body)
+	for document in filterBatch(stdin, framing):
+		page = filterText(document.decode('utf-8-sig'), theHeader).encode('utf-8')
+
+		if framing == 'length':
+			stdout.write(("%d\n" % len(page)).encode('ascii') + page)
+		else:
+			stdout.write(page + b"\0")
 
+		stdout.flush()
 
 # ---------------------
-# Methods: Parsing
+# Methods: daemon
 # ---------------------
 
-def pagesSpecial(filelist, path_header="", path_index=""):
-	""" Finds header & index files, and deletes them from file list
-	Returns the modified file list, new header path, new index path
-	"""
+def socket_readLine(connection):
+	""" Read from the socket until a newline (or closed). Returns bytes """
 
-	# existance of header or index in files
-	headerList = index_containing_substring(filelist, HEADER_FILENAME + ".")
-	indexList  = index_containing_substring(filelist, INDEX_FILENAME + ".")
+	data = b""
 
-	if path_header or headerList:
-		if headerList and not path_header:
-			path_header = filelist[headerList -1]
+	while not data.endswith(b"\n"):
+		chunk = connection.recv(65536)
 
-		path_header = path_find(path_header)
+		if not chunk:
+			break
 
-		if path_header in filelist:
-			filelist.remove(path_header)
+		data += chunk
 
-	if path_index or indexList:
-		if indexList and not path_index:
-			indexList = filelist[indexList -1]
+	return data
 
-		path_index = path_find(path_index)
 
-		if path_index in filelist:
-			filelist.remove(path_index)
+def socket_writeJSON(connection, data):
+	""" Send data as a JSON line """
 
-	return filelist, path_header, path_index
+	connection.sendall((json.dumps(data) + "\n").encode('utf-8'))
 
-def headerCreation(header_file=""):
-	"""Checks and creates/prepare the header"""
 
-	if header_file and os.path.exists(header_file):
-		header = Parsing(header_file)
+def daemonTask(message):
+	""" Runs a request in a worker process. Returns the response (dict), with
+	what the build printed ("output" & "errors") for the client to show.
+	Requests: {"op": "build", "argv": [...], "cwd": ..., "text": stdin if SOURCE is -}
+	or {"op": "render", "text": ..., "argv": [options]}, a build of - 
+	"""
 
-		if header.meta:
-			header.meta = "\n\r<header>" + header.meta + "</header>\n\r"
+	streams = sys.stdout, sys.stderr
+	sys.stdout, sys.stderr = StringIO(), StringIO()
 
-		if header.meta or header.html: 
-			header.html = '\n\r<section id="head">' + header.meta + \
-							header.html + "</section>\n\r"
-	else:
-		header = Parsing("")
+	try:
+		response = daemonRun(message)
+		response['output'] = sys.stdout.getvalue()
+		response['errors'] = sys.stderr.getvalue()
+	finally:
+		sys.stdout, sys.stderr = streams
 
-	return header 
+	return response
 
 
-def findH1(text):
-	""" Finds the title (h1) in the HTML and returns it. If not: return None """
+def daemonRun(message):
+	""" The request of daemonTask(). Returns the response (dict) """
 
-	if text.find("<h1 ") >- 1: # because of extensions
-		title = text[text.find("<h1 ") + 4:text.find("</h1>")]
-		title = title.split(">")[1] # dirty fix
+	argv = list(message.get('argv') or [])
 
-		return title
+	if message.get('op') == 'render':
+		argv = [STDIN_SOURCE] + argv
+	elif message.get('op') != 'build':
+		return {'ok': False, 'error': 'unknown op: ' + str(message.get('op'))}
 
-	return None
+	try:
+		if message.get('cwd'):
+			os.chdir(message['cwd'])
 
+		settings = args(argv)
 
-def futureTitle(file_path):
-	"""Gets the h1 in a file. It opens, converts and finds title """
+		if settings['file_timeout']:
+			# its workers can't start the converter processes
+			return {'ok': False, 'error': '--file-timeout isn\'t available in the daemon, build without it'}
 
-	tmp = Parsing("")
+		if settings['source'] == STDIN_SOURCE:
+			configure(settings)
+			html = filterText(message.get('text', ""), headerCreation(CONFIG['header']))
 
-	text = tmp.read(file_path)
-	tmp.mdParse(text)
+			return {'ok': True, 'html': html}
 
-	return findH1(tmp.html)
+		build(settings)
 
+	except SystemExit:
+		return {'ok': False, 'error': 'invalid request: ' + ' '.join(argv)}
+	except Exception as exc:
+		return {'ok': False, 'error': type(exc).__name__ + ': ' + str(exc)}
 
-def tocMerge(tocs):
-	"""Merge multiple TOCs (HTML) into one. Does filtering """
+	return {'ok': True}
 
-	tocDepth = CONFIG['toc']
-	tocFinal = tocs.replace('\n</ul>\n</div>', "")
 
-	if tocDepth == 0:
-		tocFinal = tocFinal.replace('<div class="toc">\n<ul>\n', "") # dont touch
-		
-		# remove blank lines
-		tocFinal = os.linesep.join([s for s in tocFinal.splitlines() if s])
+def daemonServe(connection, pool):
+	""" Answer one client (one request per connection) """
 
-	else:
-		allTocs     = tocFinal.split('<div class="toc">\n<ul>')[1:] # remove first as it's blank
-		tocBuilding = ""
+	try:
+		try:
+			message  = json.loads(socket_readLine(connection).decode('utf-8'))
+			response = pool.apply(daemonTask, (message,))
+		except ValueError:
+			response = {'ok': False, 'error': 'request is not JSON'}
 
-		for toc in allTocs:
-			toc = toc.replace('<ul>', '\n<ul>')
-			tocSplitted = toc.split("\n")[1:]
+		socket_writeJSON(connection, response)
+	except socket.error:
+		pass # client went away
+	finally:
+		connection.close()
 
-			if tocDepth == 1:
-				tocBuilding += tocSplitted[0] + "</li>"
-			else:
-				ulCount = 1
-				doPrint = True
 
-				for item in tocSplitted:
-					if item == "<ul>":
-						ulCount = ulCount + 1
-					if item == "</ul>":
-						ulCount = ulCount - 1
+def makeDaemon(socket_path):
+	""" Serve requests on the unix socket until interrupted. Each client is read 
+	in its own thread and its request runs in the pool of warm workers 
+	"""
 
-					if ulCount <= tocDepth:
-						doPrint = True
-					else:
-						if item == "<ul>": # dirty fix
-							tocBuilding += item 
-						doPrint = False
+	if os.path.exists(socket_path):
+		if not stat.S_ISSOCK(os.stat(socket_path).st_mode):
+			sys.exit("not a socket, it isn't replaced: " + socket_path)
 
-					if doPrint:
-						tocBuilding += item
+		if daemonAlive(socket_path):
+			sys.exit("a daemon is already listening on " + socket_path)
 
+		# stale socket of a previous daemon
+		os.remove(socket_path)
 
-		tocFinal = tocBuilding
+	server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
 
-	return '<div class="toc"><ul>' + tocFinal + '</ul></div>' 
+	# only this user can connect, from the start
+	umask = os.umask(0o177)
 
+	try:
+		server.bind(socket_path)
+	finally:
+		os.umask(umask)
 
-def wikiLinks(text):
-	""" Process "wiki" links: [](file|file.md) to [file title](newpath.html).
-	It must be a markdown file, opened before (string)
-	"""
+	os.chmod(socket_path, 0o600)
+	server.listen(64)
 
-	textNew = list()
-	
-	for line in text:
-		if "](file|" in line:
-			if line.find("[](file|") > -1: 
-				linkedFileName = line[line.find("[](file|") + 8 : line.find(")")]
-
-				if os.path.exists(linkedFileName):
-					title = futureTitle(linkedFileName)
-					if title: 
-						line = line.replace("[](file|", "[" + title + "](")
-				else:
-					line = line.replace("[](file|", "[" + linkedFileName + "](")
+	pool = multiprocessing.Pool(CONFIG['jobs'] or None, initializer=daemonWorker)
 
+	# stop cleanly when killed too (the workers ignore it, see daemonWorker())
+	signal.signal(signal.SIGTERM, daemonStop)
 
-			else:
-				# has custom title. Delete file| and find output path
-				linkedFileName = line[line.find("](file|") + 7 : line.find(")")]
-				line = line.replace("](file|", "](")
+	print ("    listening on " + socket_path)
 
-			# finds the output link and replaces
-			outputPath = path_getFilename(path_output(linkedFileName))
-			line       = line.replace(linkedFileName, outputPath)
-				
+	try:
+		while True:
+			connection, _ = server.accept()
 
+			client = threading.Thread(target=daemonServe, args=(connection, pool))
+			client.daemon = True
+			client.start()
 
-			textNew.append(line)
+	except KeyboardInterrupt:
+		pass
 
-	return textNew
+	finally:
+		server.close()
+		os.remove(socket_path)
+		daemonShutdown(pool)
 
 
-def makeFiles(theHeader):
-	""" Process files in folder, alone, or .list. No book option """
+def daemonWorker():
+	""" Initializer of the pool: ctrl+c and SIGTERM (sent to the whole process
+	group too) are left to the daemon, which stops the workers itself 
+	"""
 
-	doMerge = CONFIG['merge']
+	signal.signal(signal.SIGINT, signal.SIG_IGN)
+	signal.signal(signal.SIGTERM, signal.SIG_IGN)
 
-	projectWhole = ""
-	projectTocs  = ""
-	
-	for this_file in CONFIG['fileslist']:
-		file_current = Parsing(this_file)
+	md_converter()
 
-		if not doMerge:
-			file_current.html = html_finalText(file_current, theHeader)
-			file_current.save()
-		else:
-			projectTocs  += file_current.toc
-			projectWhole += '\r\n <article>' + file_current.meta + \
-							file_current.html + "</article>\n\r"
 
-	if doMerge:
-		outputName = path_lastDir(path_get(file_current.outputPath)) + ".html"
+def daemonShutdown(pool):
+	""" Stop the workers: the running requests get DAEMON_GRACE seconds to 
+	finish, then the workers are killed. Not pool.terminate(), it blocks on 
+	workers that ignore SIGTERM or died holding the queue's lock 
+	"""
 
-		# "reset" file_current
-		file_current.html       = ""
-		file_current.outputPath = ""
+	pool.close()
 
-		projectTocs = tocMerge(projectTocs)
-		header_text = theHeader.html.replace('[TOC_HERE]', projectTocs)
+	joiner = threading.Thread(target=pool.join)
+	joiner.daemon = True
+	joiner.start()
+	joiner.join(DAEMON_GRACE)
 
-		file_current.html = html_complete(theHeader.title, header_text, projectWhole)
+	if joiner.is_alive():
+		for worker in multiprocessing.active_children():
+			os.kill(worker.pid, signal.SIGKILL)
 
-		path_dir = CONFIG['output'] if CONFIG['output'] else os.getcwd()
-		file_current.outputPath = path_dir + '\\'+ outputName
+		# the threads of the pool wait for the killed requests forever
+		os._exit(1)
 
-		file_current.save()
 
+def daemonStop(signum, frame):
+	""" Signal handler: stop the daemon as with ctrl+c """
 
-def makeBook(theHeader):
-	""" Process files if indicated to be in a book """
+	raise KeyboardInterrupt
 
-	list_files = CONFIG['fileslist']
 
-	bookIndex  = "<ul>"
-	filesTotal = len(list_files)
+def daemonAlive(socket_path):
+	""" True if a daemon answers on the socket """
 
-	i = 0 
-	while i < filesTotal:
+	client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
 
-		if i == 0:
-			data_prev = Parsing("")
+	try:
+		client.connect(socket_path)
+		return True
+	except socket.error:
+		return False
+	finally:
+		client.close()
 
-		data_current = Parsing(list_files[i])
-		
-		if i+1 < filesTotal:
-			data_next = Parsing(list_files[i+1])
-		else:
-			data_next = Parsing("")
 
-		current_relative = path_relative_to(data_current.outputPath, None, True)
-		bookIndex += '<li><a href="' + current_relative + '">' + \
-						data_current.title + '</a></li>'
+def daemonRequest(socket_path, message):
+	""" Send a request to the daemon. Returns its response, None if it isn't running """
 
-		navigation = html_bookNavigation(data_current.outputPath, data_prev.outputPath, data_prev.title, 
-										data_next.outputPath, data_next.title)
+	client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
 
-		data_current.html = html_finalText(data_current, theHeader, navigation)
-		data_current.save()
+	try:
+		client.connect(socket_path)
+	except socket.error:
+		client.close()
+		return None
 
-		data_prev    = data_current
-		data_current = data_next
-		data_next    = Parsing("")
+	try:
+		socket_writeJSON(client, message)
+		line = socket_readLine(client)
+	finally:
+		client.close()
 
-		i += 1
+	if not line.endswith(b"\n"):
+		# stopped while it ran the request (daemonShutdown())
+		return {'ok': False, 'error': 'the daemon stopped before answering'}
 
-	index = ""
-	# Process the indicated file
-	if indexFile and os.path.exists(indexFile):
+	return json.loads(line.decode('utf-8'))
 
-		index = Parsing(indexFile, True)
-		index.outputPath = os.path.join(CONFIG['output'],'index.html')
 
-		parsedIndex = index.read(indexFile)
-		parsedIndex = parsedIndex.split("\n")
-		parsedIndex = wikiLinks(parsedIndex)
+def makeClient(settings, argv):
+	""" Forward the invocation to the daemon. Returns False if it isn't running """
 
-		# back to text
-		parsedIndex = '\n'.join(n for n in parsedIndex)
+	message = {'op': 'build', 'argv': argv, 'cwd': os.getcwd()}
+	stdin, stdout = std_streams()
 
-		index.mdParse(parsedIndex)
+	if settings['source'] == STDIN_SOURCE:
+		message['text'] = stdin.read().decode('utf-8-sig')
 
-		if index.title == index.outputPath:
-			index.title = "Index"
+	response = daemonRequest(settings['connect'], message)
 
-		index.html = html_complete("Index", "", index.html)
+	if response is None:
+		if 'text' not in message:
+			return False
 
-		index.save()
+		# stdin is already read, render it here
+		configure(settings)
+		html     = filterText(message['text'], headerCreation(CONFIG['header']))
+		response = {'ok': True, 'html': html}
 
-	# Or create one
-	else:
-		index = Parsing("")
+	# what the build printed in the daemon
+	stdout.write(response.get('output', "").encode('utf-8'))
+	stdout.flush()
+	getattr(sys.stderr, 'buffer', sys.stderr).write(response.get('errors', "").encode('utf-8'))
 
-		index.title      = theHeader.title if theHeader.title else "Index"
-		index.html       = html_complete(index.title, "", bookIndex + "</ul>")
+	if not response['ok']:
+		sys.stderr.write(response['error'] + "\n")
+		sys.exit(1)
 
-		path_dir = CONFIG['output'] if CONFIG['output'] else os.getcwd()
-		index.outputPath = path_dir + '\\index.html'
+	if 'html' in response:
+		stdout.write(response['html'].encode('utf-8'))
+		stdout.flush()
+
+	return True
 
-		index.save()
- 
 # -------------------
 # The program
 # -------------------
 
-if __name__ == '__main__':
-	settings = args()
+def configure(settings):
+	""" Set CONFIG from args() values """
 
 	for key, val in settings.items():
 		CONFIG[key] = val
 
-	if CONFIG['extensions']:
-		SELECTED_EXTENSIONS = SELECTED_EXTENSIONS + CONFIG['extensions']
+	# extension profiles, of the .list (files_list()) & the folders
+	CONFIG['list_extensions'] = list()
+	PROFILES.clear()
+
+	# the time is taken in the converters of this process
+	if CONFIG['profile_extensions']:
+		CONFIG['file_timeout'] = 0
+
+	if CONFIG['engine'] == 'mistune' and mistune is None:
+		print ("mistune library not installed")
+		sys.exit()
+
+
+def build(settings):
+	""" Do the magic: process SOURCE (or stdin) with args() values """
+
+	global CHANGES, MEMORY, PROFILE
+
+	configure(settings)
+
+	if CONFIG['source'] == STDIN_SOURCE:
+		makeFilter(headerCreation(CONFIG['header']))
+		return
+
+	del TIMEOUTS[:]
+
+	CHANGES = OutputChanges()
+	MEMORY  = MemReport(CONFIG['mem_budget']) if CONFIG['mem_report'] or CONFIG['mem_budget'] else None
+
+	if CONFIG['profile_extensions']:
+		# the converters made from now on are timed
+		CONVERTERS.md = dict()
+		PROFILE = ExtensionProfile()
+		conversions = STATS.get('conversions', 0)
+
+	try:
+		if CONFIG['atomic']:
+			makeAtomic()
+		else:
+			makeProject()
+	finally:
+		if MEMORY is not None:
+			MEMORY.stop()
+
+			if CONFIG['mem_report']:
+				MEMORY.report(CONFIG['mem_report'])
+
+			MEMORY = None
+
+		if PROFILE is not None:
+			PROFILE.report(STATS.get('conversions', 0) - conversions)
+			CONVERTERS.md = dict()
+			PROFILE = None
+
+		worker = getattr(WORKERS, 'worker', None)
+
+		if worker is not None and worker.process is not None:
+			worker.stop()
+
+	if TIMEOUTS:
+		print ("\n    timed out (over %s s, %s):" % (CONFIG['file_timeout'], CONFIG['on_timeout']))
+
+		for seconds, path in sorted(TIMEOUTS, reverse=True):
+			print ("      %6.1f s  %s" % (seconds, path))
+
+
+def makeProject():
+	""" Process the files of SOURCE with CONFIG """
+
+	global ASSETS, LOADER, LINKS, PROGRESS
 
 	CONFIG['fileslist'] = files_list(CONFIG['source'])
 	CONFIG['fileslist'], headerFile, indexFile = pagesSpecial(CONFIG['fileslist'], 
 											CONFIG['header'], 
 											CONFIG['index'])
 
-	# do the magic
 	header = headerCreation(headerFile)
+	graph  = DepGraph(path_buildFile(DEPS_FILENAME) if CONFIG['output'] else None)
+	ASSETS = AssetMirror(graph) if CONFIG['assets'] and CONFIG['output'] else None
+
+	if CONFIG['book'] and len(CONFIG['fileslist']) < 2:
+		print ("sorry, you can't")
+		sys.exit()
+
+	cache = ParseCache(len(CONFIG['targets']))
+	LINKS = LinkTable(CONFIG['fileslist'], graph, cache)
+
+	if CONFIG['progress']:
+		PROGRESS = Progress(len(CONFIG['fileslist']) * len(CONFIG['targets']), CONFIG['progress'])
+
+	# incremental builds read only what changed, reading ahead would waste it
+	LOADER = SourceLoader(CONFIG['fileslist'], prefetch=not CONFIG['incremental'])
+
+	try:
+		for target in CONFIG['targets']:
+			if target == 'book':
+				output = CONFIG['output']
+
+				if len(CONFIG['targets']) > 1 and output:
+					CONFIG['output'] = os.path.join(output, BOOK_FOLDER)
+
+				try:
+					makeBook(header, graph, cache, indexFile)
+				finally:
+					CONFIG['output'] = output
+			else:
+				makeFiles(header, graph, cache, target == 'merge')
+	finally:
+		LOADER.close()
+		LOADER = None
+		LINKS  = None
+
+		if PROGRESS is not None:
+			PROGRESS.finish()
+			PROGRESS = None
+
+	graph.save()
+
+	for stale in graph.stale():
+		if os.path.exists(stale):
+			os.remove(stale)
+
+		CHANGES.record('D', stale)
+
+	if CONFIG['output']:
+		CHANGES.save(path_buildFile(CHANGED_FILENAME), CONFIG['output'])
+
+
+def atomic_builds(live):
+	""" Build folders (--atomic) next to the live output: (number, path), oldest first """
+
+	parent, name = os.path.split(os.path.abspath(live))
+	prefix = "." + name + ".pymd-"
+	builds = list()
+
+	for entry in os.listdir(parent):
+		if entry.startswith(prefix) and entry[len(prefix):].isdigit():
+			builds.append((int(entry[len(prefix):]), os.path.join(parent, entry)))
+
+	return sorted(builds)
 
-	if CONFIG['book']:
-		if len(CONFIG['fileslist']) < 2:
-			print ("sorry, you can't")
-			sys.exit()
 
-		makeBook(header)
+def atomic_stage(live):
+	""" New build folder for the live output, with hardlinks of its files so 
+	only what changes is written. Returns its path
+	"""
+
+	parent, name = os.path.split(os.path.abspath(live))
+	builds  = atomic_builds(live)
+	staging = os.path.join(parent, "." + name + ".pymd-" + str(builds[-1][0] + 1 if builds else 1))
+
+	path_mkdir(staging)
+
+	if os.path.isdir(live):
+		current = os.path.realpath(live)
+
+		for folder, _, files in os.walk(current):
+			for entry in files:
+				path = os.path.join(folder, entry)
+				file_link(path, os.path.join(staging, os.path.relpath(path, current)))
+
+	return staging
+
+
+def atomic_publish(live, staging):
+	""" Make the staging folder the live output in one step: the output is a 
+	symlink to the build and it's replaced (rename). The previous build is
+	kept, readers may be in it; older ones are removed
+	"""
+
+	parent, name = os.path.split(os.path.abspath(live))
+	previous = os.path.join(parent, "." + name + ".pymd-0")
+
+	# a real folder (first --atomic build) becomes a build too
+	if os.path.isdir(live) and not os.path.islink(live):
+		if os.path.exists(previous):
+			shutil.rmtree(previous)
+
+		os.rename(live, previous)
+
+	if hasattr(os, 'symlink'):
+		link = os.path.join(parent, "." + name + ".pymd-link")
+
+		if os.path.lexists(link):
+			os.remove(link)
+
+		os.symlink(os.path.basename(staging), link)
+		os.rename(link, live)
 	else:
-		makeFiles(header)
+		# no symlinks (windows): the output is missing for a moment
+		os.rename(staging, live)
+
+	current = os.path.realpath(live)
+
+	for _, path in atomic_builds(live)[:-2]:
+		if path != current:
+			shutil.rmtree(path)
+
+
+def makeAtomic():
+	""" makeProject() in a staging copy of the output, then publish it (--atomic) """
+
+	global ATOMIC
+
+	live = CONFIG['output']
+
+	if not live:
+		print ("sorry, --atomic needs an output folder (-o)")
+		sys.exit()
+
+	staging = atomic_stage(live)
+	ATOMIC  = (live, staging)
+	CONFIG['output'] = staging
+
+	try:
+		makeProject()
+	except BaseException:
+		shutil.rmtree(staging)
+		raise
+	finally:
+		CONFIG['output'] = live
+		ATOMIC = None
+
+	atomic_publish(live, staging)
+
+
+if __name__ == '__main__':
+	settings = args()
+
+	if settings['daemon']:
+		configure(settings)
+		makeDaemon(settings['daemon'])
+		sys.exit()
+
+	# the daemon can't kill conversions (--file-timeout), they're run here
+	forwarded = settings['connect'] and not settings['batch'] and not settings['file_timeout'] and \
+					makeClient(settings, sys.argv[1:])
 
-	print ("\n    done")
+	if not forwarded:
+		build(settings)
 
+	if settings['source'] != STDIN_SOURCE:
+		print ("\n    done")